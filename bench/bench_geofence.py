@@ -0,0 +1,103 @@
+"""ジオフェンス判定の速度 (fix/秒) を区域数ごとに測る
+
+約20km四方にランダムな円と多角形の区域を置き、その中を走る車両の軌跡
+(10Hz のランダムウォーク) を1点ずつ GeofenceIndex.update に通す。
+比較のため、格子を使わず全区域を順に調べる場合の速度も表示する。
+
+使い方 (リポジトリ直下で):
+    python -m bench.bench_geofence --fences 1000,10000 --fixes 100000
+"""
+import argparse
+import math
+import random
+import time
+
+from bench.bench_simplify import random_walk
+from geofence import CircleFence, GeofenceIndex, PolygonFence
+from simplify import EARTH_RADIUS
+
+BASE_LAT, BASE_LON = 35.681236, 139.767125
+AREA = 20000.0  # 区域を置く範囲の一辺 (m)
+
+
+def random_fences(count, seed=1):
+    """半径 20〜300m の円と、同程度の大きさの 4〜12 角形を半分ずつ"""
+    rng = random.Random(seed)
+    m_lat = 111320.0
+    m_lon = m_lat * math.cos(math.radians(BASE_LAT))
+    fences = []
+    for i in range(count):
+        lat = BASE_LAT + rng.uniform(-AREA / 2, AREA / 2) / m_lat
+        lon = BASE_LON + rng.uniform(-AREA / 2, AREA / 2) / m_lon
+        size = rng.uniform(20, 300)
+        if i % 2:
+            fences.append(CircleFence(f"c{i}", f"circle {i}", lat, lon, size))
+            continue
+        n = rng.randint(4, 12)
+        ring = []
+        for k in range(n):
+            angle = 2 * math.pi * k / n
+            r = size * rng.uniform(0.5, 1.0)
+            ring.append((lat + r * math.sin(angle) / m_lat, lon + r * math.cos(angle) / m_lon))
+        fences.append(PolygonFence(f"p{i}", f"polygon {i}", ring))
+    return fences
+
+
+def linear_update(index, inside, lat, lon):
+    """比較用: 全区域を順に調べる (外接矩形での絞り込みも含め、判定の内容は GeofenceIndex.update と同じ)"""
+    x = lon * index._kx
+    y = lat * math.radians(1) * EARTH_RADIUS
+    events = 0
+    margin = index.margin
+    for fence in index.fences.values():
+        x0, y0, x1, y1 = fence.bbox
+        if x < x0 - margin or x > x1 + margin or y < y0 - margin or y > y1 + margin:
+            if fence.id in inside:
+                inside.discard(fence.id)
+                events += 1
+            continue
+        if fence.id in inside:
+            if not fence.contains(x, y) and fence.distance(x, y) >= index.margin:
+                inside.discard(fence.id)
+                events += 1
+        elif fence.contains(x, y):
+            inside.add(fence.id)
+            events += 1
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fences", default="1000,10000", help="区域数 (カンマ区切り)")
+    parser.add_argument("--fixes", type=int, default=100000, help="判定する fix の数")
+    parser.add_argument("--linear-fixes", type=int, default=2000, help="全区域を順に調べる場合の fix の数")
+    args = parser.parse_args()
+
+    lats, lons = random_walk(args.fixes, lat=BASE_LAT, lon=BASE_LON)
+    lats, lons = lats.tolist(), lons.tolist()
+    for count in (int(v) for v in args.fences.split(",")):
+        fences = random_fences(count)
+        start = time.perf_counter()
+        index = GeofenceIndex(fences)
+        build = time.perf_counter() - start
+
+        events = 0
+        start = time.perf_counter()
+        for i in range(args.fixes):
+            events += len(index.update("bench", lats[i], lons[i], i / 10))
+        elapsed = time.perf_counter() - start
+
+        inside = set()
+        n = min(args.linear_fixes, args.fixes)
+        start = time.perf_counter()
+        for i in range(n):
+            linear_update(index, inside, lats[i], lons[i])
+        linear = time.perf_counter() - start
+
+        print(f"[区域 {count:,}] 索引の構築 {build * 1e3:.0f} ms, 格子 {len(index._cells):,} 個")
+        print(f"    格子: {args.fixes / elapsed:,.0f} fix/秒 ({elapsed / args.fixes * 1e6:.1f} µs/fix), イベント {events:,} 件")
+        print(f"    全件: {n / linear:,.0f} fix/秒 ({linear / n * 1e6:.1f} µs/fix)")
+
+
+if __name__ == "__main__":
+    main()
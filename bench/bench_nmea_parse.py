@@ -0,0 +1,58 @@
+"""高速デコーダ (nmea_fast) と pynmea2.parse の速度比較
+
+使い方 (リポジトリ直下で):
+    python -m bench.bench_nmea_parse                 # 合成コーパス
+    python -m bench.bench_nmea_parse --corpus gps.log  # 実機の記録
+"""
+import argparse
+import time
+
+import pynmea2
+
+import nmea_fast
+from bench.corpus import load_corpus
+
+
+def _time_it(func, lines, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            try:
+                func(line)
+            except pynmea2.ParseError:
+                pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="NMEAの記録ファイル (省略時は合成)")
+    parser.add_argument("--epochs", type=int, default=2000, help="合成するエポック数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    raw = [line.strip() for line in load_corpus(args.corpus, args.epochs)]
+    hot = [line for line in raw if line[line.find(b",") - 3:line.find(b",")] in nmea_fast.HOT_SENTENCES]
+    print(f"コーパス: {len(raw)} 文 (うち GGA/RMC/VTG/GSA: {len(hot)} 文)")
+
+    # 旧実装と同じく str にデコードしてから pynmea2.parse する
+    t_pynmea2 = _time_it(lambda line: pynmea2.parse(line.decode("ascii", errors="replace")), hot, args.repeat)
+    t_fast = _time_it(nmea_fast.decode, hot, args.repeat)
+    t_mixed_old = _time_it(lambda line: pynmea2.parse(line.decode("ascii", errors="replace")), raw, args.repeat)
+    t_mixed_new = _time_it(nmea_fast.parse, raw, args.repeat)
+
+    def row(name, seconds, n):
+        print(f"{name:<28} {seconds * 1e3:9.1f} ms  {n / seconds:12,.0f} 文/秒")
+
+    row("pynmea2.parse (hot)", t_pynmea2, len(hot))
+    row("nmea_fast.decode (hot)", t_fast, len(hot))
+    print(f"  -> {t_pynmea2 / t_fast:.1f} 倍")
+    row("pynmea2.parse (全文)", t_mixed_old, len(raw))
+    row("nmea_fast.parse (全文)", t_mixed_new, len(raw))
+    print(f"  -> {t_mixed_old / t_mixed_new:.1f} 倍")
+
+
+if __name__ == "__main__":
+    main()
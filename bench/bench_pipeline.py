@@ -0,0 +1,146 @@
+"""取り込みから配信までの一連の処理のベンチマーク (実機不要)
+
+replay の合成データを実機と同じ取り込み処理に流し、以下を測る。
+  1. 取り込み -> 解析 -> 状態更新 (handle_epoch) の処理量 (文/秒, エポック/秒)
+  2. /status の処理量 (Flask のテストクライアントで1スレッドから)
+  3. fix がポートに届いてから SSE でクライアントが受け取るまでの遅延
+     (実際に HTTP サーバを立て、10Hz の等速再生を /stream で受ける)
+GPIO は sim_gpio、ログはテンポラリディレクトリに書く。
+
+使い方 (リポジトリ直下で):
+    python -m bench.bench_pipeline --epochs 20000 --latency-seconds 10
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_main(workdir):
+    # main は import 時に入力元と機体を作るので、その前に設定とカレントディレクトリを決める
+    os.environ["GPS_SOURCES"] = "bench=sim:10@0,live=sim:10@1"
+    os.environ["GPS_SIM_GPIO"] = "1"
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    import main
+    return main
+
+
+def bench_ingest(main, epochs):
+    from nmea_ingest import NMEAIngest
+    from replay import ReplayPort, synthetic_epochs
+    from sources import SourceClosed
+
+    device = main.devices["bench"]
+    port = ReplayPort(synthetic_epochs(hz=10, count=epochs), speed=0)
+    ingest = NMEAIngest(device.ingest_stats)
+    start = time.perf_counter()
+    while True:
+        try:
+            for epoch in ingest.poll(port):
+                main.handle_epoch(device, epoch)
+        except SourceClosed:
+            for epoch in ingest.finish():
+                main.handle_epoch(device, epoch)
+            break
+    elapsed = time.perf_counter() - start
+    stats = device.ingest_stats
+    print(f"[取り込み->解析->状態更新] {stats['sentences']:,} 文 / {stats['epochs']:,} エポック: {elapsed:.2f} 秒")
+    print(f"    {stats['sentences'] / elapsed:,.0f} 文/秒, {stats['epochs'] / elapsed:,.0f} エポック/秒"
+          f" (10Hz の受信機 {stats['epochs'] / elapsed / 10:,.0f} 台分)")
+
+
+def bench_status(main, requests):
+    client = main.app.test_client()
+    etag = client.get("/status?device=bench").headers["ETag"]
+    for name, headers in (("/status", {}), ("/status (304)", {"If-None-Match": etag})):
+        start = time.perf_counter()
+        for _ in range(requests):
+            client.get("/status?device=bench", headers=headers)
+        elapsed = time.perf_counter() - start
+        print(f"[{name}] {requests / elapsed:,.0f} req/秒 ({elapsed / requests * 1e6:.0f} µs/req)")
+
+
+def bench_latency(main, seconds):
+    from werkzeug.serving import make_server
+    from nmea_ingest import NMEAIngest
+    from replay import ReplayPort, synthetic_epochs
+
+    device = main.devices["live"]
+    server = make_server("127.0.0.1", 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = ReplayPort(synthetic_epochs(hz=10), speed=1, record_emitted=True)
+    latencies = []
+    deadline = time.time() + seconds
+
+    def feed():
+        ingest = NMEAIngest(device.ingest_stats)
+        while time.time() < deadline:
+            for epoch in ingest.poll(port):
+                main.handle_epoch(device, epoch)
+
+    def subscribe():
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=seconds + 5)
+        conn.request("GET", "/stream?device=live")
+        response = conn.getresponse()
+        while time.time() < deadline:
+            line = response.readline()
+            if not line:
+                break
+            if not line.startswith(b"data: "):
+                continue
+            received = time.perf_counter()
+            data = json.loads(line[6:])
+            if not data.get("time"):
+                continue
+            hh, mm, ss = data["time"].split("+")[0].split(":")
+            emitted = port.emitted.get(round(int(hh) * 3600 + int(mm) * 60 + float(ss), 2))
+            if emitted is not None:
+                latencies.append((received - emitted) * 1e3)
+        conn.close()
+
+    subscriber = threading.Thread(target=subscribe, daemon=True)
+    subscriber.start()
+    time.sleep(0.2)
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    feeder.join()
+    subscriber.join(2)
+    server.shutdown()
+    if not latencies:
+        print("[fix -> クライアント] 計測できませんでした")
+        return
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"[fix -> クライアント] {len(latencies)} 件: 平均 {statistics.mean(latencies):.1f} ms / "
+          f"中央値 {latencies[len(latencies) // 2]:.1f} ms / p95 {p95:.1f} ms / 最大 {latencies[-1]:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--epochs", type=int, default=20000, help="処理量の計測に流すエポック数")
+    parser.add_argument("--requests", type=int, default=5000, help="/status の計測回数")
+    parser.add_argument("--latency-seconds", type=float, default=10.0, help="遅延の計測時間 (秒)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_main = _load_main(workdir)
+        app_main.setup_gpio()
+        bench_ingest(app_main, args.epochs)
+        bench_status(app_main, args.requests)
+        bench_latency(app_main, args.latency_seconds)
+        app_main.running = False
+        for device in app_main.devices.values():
+            device.tracklog_writer.close()
+        os.chdir(ROOT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""/status の配信方式ごとの負荷試験 (同時閲覧者 50 以上を想定)
+
+起動中のサーバに対して、閲覧者1人につき1スレッドで以下のいずれかを行う。
+    poll : 従来どおり 2 秒ごとに /status を取得
+    etag : 2 秒ごとに If-None-Match 付きで /status を取得 (変化なしなら 304)
+    sse  : /stream を購読し続ける
+1秒あたりのリクエスト数、応答時間、fix 公開からクライアント受信までの遅延を表示する。
+遅延はサーバと同じ時計で測るため、サーバと同じマシンで実行すること。
+
+使い方 (リポジトリ直下で):
+    python -m bench.bench_push --mode sse --viewers 50 --duration 30
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class Result:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.not_modified = 0
+        self.errors = 0
+        self.response_ms = []
+        self.fix_latency_ms = []
+
+    def add(self, response_ms=None, fix_latency_ms=None, not_modified=False):
+        with self.lock:
+            if response_ms is not None:
+                self.requests += 1
+                self.response_ms.append(response_ms)
+            if not_modified:
+                self.not_modified += 1
+            if fix_latency_ms is not None:
+                self.fix_latency_ms.append(fix_latency_ms)
+
+
+def _poll_viewer(host, port, interval, use_etag, deadline, result):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    etag = None
+    seen = 0
+    while time.time() < deadline:
+        headers = {"If-None-Match": etag} if use_etag and etag else {}
+        start = time.perf_counter()
+        try:
+            conn.request("GET", "/status", headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            with result.lock:
+                result.errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            time.sleep(interval)
+            continue
+        elapsed = (time.perf_counter() - start) * 1e3
+        if response.status == 304:
+            result.add(elapsed, not_modified=True)
+        else:
+            data = json.loads(body)
+            etag = response.getheader("ETag")
+            latency = None
+            if data.get("version", 0) > seen and "published" in data:
+                seen = data["version"]
+                latency = (time.time() - data["published"]) * 1e3
+            result.add(elapsed, latency)
+        time.sleep(interval)
+    conn.close()
+
+
+def _sse_viewer(host, port, deadline, result):
+    conn = http.client.HTTPConnection(host, port, timeout=max(1.0, deadline - time.time()))
+    start = time.perf_counter()
+    try:
+        conn.request("GET", "/stream")
+        response = conn.getresponse()
+        result.add((time.perf_counter() - start) * 1e3)
+        while time.time() < deadline:
+            line = response.readline()
+            if not line:
+                break
+            if line.startswith(b"data: "):
+                data = json.loads(line[6:])
+                if "published" in data:
+                    result.add(fix_latency_ms=(time.time() - data["published"]) * 1e3)
+    except (OSError, http.client.HTTPException):
+        if time.time() < deadline:
+            with result.lock:
+                result.errors += 1
+    finally:
+        conn.close()
+
+
+def _summary(name, values):
+    if not values:
+        return f"{name}: ---"
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return f"{name}: 平均 {statistics.mean(values):.1f} ms / 中央値 {values[len(values) // 2]:.1f} ms / p95 {p95:.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:7777")
+    parser.add_argument("--mode", choices=("poll", "etag", "sse"), default="sse")
+    parser.add_argument("--viewers", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--interval", type=float, default=2.0, help="poll/etag の取得間隔 (秒)")
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    host, port = url.hostname, url.port or 80
+    result = Result()
+    deadline = time.time() + args.duration
+    threads = []
+    for i in range(args.viewers):
+        if args.mode == "sse":
+            target, targs = _sse_viewer, (host, port, deadline, result)
+        else:
+            target, targs = _poll_viewer, (host, port, args.interval, args.mode == "etag", deadline, result)
+        t = threading.Thread(target=target, args=targs, daemon=True)
+        t.start()
+        threads.append(t)
+        # 閲覧者の取得タイミングを散らす
+        time.sleep(args.interval / args.viewers if args.mode != "sse" else 0.01)
+    for t in threads:
+        t.join(args.duration + 10)
+
+    print(f"モード: {args.mode} / 閲覧者: {args.viewers} / {args.duration:.0f} 秒")
+    print(f"リクエスト数: {result.requests} ({result.requests / args.duration:.1f} req/s), "
+          f"うち 304: {result.not_modified}, エラー: {result.errors}")
+    print(_summary("応答時間", result.response_ms))
+    print(_summary("fix 公開からの遅延", result.fix_latency_ms))
+    print(f"受信した更新数: {len(result.fix_latency_ms)}")
+
+
+if __name__ == "__main__":
+    main()
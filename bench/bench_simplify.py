@@ -0,0 +1,63 @@
+"""軌跡の間引き (simplify) の速度と応答サイズをズームレベルごとに測る
+
+100万点 (10Hzで約28時間分) のランダムウォークを TrackBuffer に入れ、
+ズームごとに初回の間引き時間、/track/simplified 相当の JSON サイズ、
+新しい fix を10点追加したあとの差分更新の時間を表示する。
+
+使い方 (リポジトリ直下で):
+    python -m bench.bench_simplify --points 1000000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from simplify import SimplifiedTrackCache
+from track import TrackBuffer
+
+
+def random_walk(n, lat=35.681236, lon=139.767125, hz=10, seed=1):
+    """速度と向きがゆっくり変わる車両の軌跡 (1点 = 1/hz 秒)"""
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.05, n))
+    speed = np.clip(8 + np.cumsum(rng.normal(0, 0.05, n)), 0, 25) / hz  # m/点
+    north = np.cumsum(speed * np.cos(heading))
+    east = np.cumsum(speed * np.sin(heading))
+    lats = lat + north / 111320.0
+    lons = lon + east / (111320.0 * np.cos(np.radians(lat)))
+    return lats, lons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--zooms", default="5,8,11,13,15,17,19")
+    args = parser.parse_args()
+
+    lats, lons = random_walk(args.points)
+    track = TrackBuffer(args.points + 1000)
+    t0 = time.time() - args.points / 10
+    for i, (la, lo) in enumerate(zip(lats.tolist(), lons.tolist())):
+        track.append(t0 + i / 10, la, lo)
+    raw_size = len(json.dumps({"lat": lats.tolist(), "lon": lons.tolist()}))
+    print(f"点数: {args.points:,} / 間引きなしの JSON: {raw_size / 1e6:.1f} MB")
+    print(f"{'zoom':>4} {'点数':>10} {'JSON':>10} {'初回':>10} {'差分更新':>10}")
+
+    cache = SimplifiedTrackCache(track)
+    for zoom in (int(z) for z in args.zooms.split(",")):
+        start = time.perf_counter()
+        seqs, lat, lon, _ = cache.get(zoom)
+        first = time.perf_counter() - start
+        size = len(json.dumps({"lat": lat.tolist(), "lon": lon.tolist()}))
+        # 新しい fix を追加して差分更新の時間を測る
+        for k in range(10):
+            track.append(time.time(), float(lats[-1]) + k * 1e-5, float(lons[-1]))
+        start = time.perf_counter()
+        cache.get(zoom)
+        incremental = time.perf_counter() - start
+        print(f"{zoom:>4} {len(seqs):>10,} {size / 1e3:>8.1f}kB {first * 1e3:>8.1f}ms {incremental * 1e3:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""ベンチマーク用のNMEAコーパス
+
+--corpus で実機の記録 (minicom のログなど) を渡せばそれを使い、
+なければ replay の合成データ (GGA+RMC+VTG+GSA+GSV のエポック) を使う。
+"""
+from replay import synthetic_epochs
+
+
+def synthetic_corpus(epochs=2000, hz=10):
+    """円を描いて走る車両の記録を合成する (bytes のリスト)"""
+    lines = []
+    for epoch in synthetic_epochs(hz=hz, count=epochs):
+        lines.extend(epoch)
+    return lines
+
+
+def load_corpus(path=None, epochs=2000):
+    if path is None:
+        return synthetic_corpus(epochs)
+    with open(path, "rb") as f:
+        return [line for line in f if line.startswith(b"$")]
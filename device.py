@@ -0,0 +1,33 @@
+"""機体 (GPS受信機1台) ごとの状態
+
+最新の fix・生データ・取り込みカウンタ・軌跡・ディスクのログ・配信部を機体ごとに持つ。
+機体同士はロックを共有しないので、1台の処理が遅れても他の機体は止まらない。
+"""
+import os
+from threading import Lock
+
+from nmea_ingest import new_stats
+from simplify import SimplifiedTrackCache
+from track import TrackBuffer
+import tracklog
+
+
+class Device:
+    def __init__(self, device_id, broadcaster, track_capacity, tracklog_dir, data_lock=None, pps=False):
+        self.device_id = device_id
+        self.gps_data = {"time": None, "lat": None, "lon": None, "alt": None, "speed": None, "hdop": None}
+        self.raw_data = ""
+        self.data_lock = data_lock if data_lock is not None else Lock()  # gps_data / raw_data 用
+        self.fix_time = None  # 最新の fix の時刻 (UNIX時刻, PPSがあればPPS基準)
+        self.fix_pps = False  # fix_time が PPS 基準か
+        self.pps = pps  # GPIO18 の 1PPS がこの機体の受信機のものか (違えば受信時刻を使う)
+        self.ingest_stats = new_stats()
+        self.connected = False
+        self.track = TrackBuffer(track_capacity)
+        self.tracklog_dir = os.path.join(tracklog_dir, device_id)
+        self.tracklog_writer = tracklog.TrackLogWriter(self.tracklog_dir)
+        self.simplified_track = SimplifiedTrackCache(self.track)
+        self.broadcaster = broadcaster
+
+    def __repr__(self):
+        return f"Device({self.device_id!r})"
@@ -0,0 +1,63 @@
+"""ログの fix を GPX / GeoJSON として少しずつ書き出すジェネレータ
+
+どちらも fix を1件ずつ文字列にして返すので、範囲全体をメモリに載せずに
+Flask のストリーミング応答にそのまま渡せる。
+"""
+import json
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+CHUNK_RECORDS = 500  # 何件ごとに1つの文字列にまとめて返すか
+
+
+def _iso(t):
+    return datetime.fromtimestamp(t, timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _chunked(lines):
+    buf = []
+    for line in lines:
+        buf.append(line)
+        if len(buf) >= CHUNK_RECORDS:
+            yield "".join(buf)
+            buf = []
+    if buf:
+        yield "".join(buf)
+
+
+def gpx(records, name="gps-tracker"):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<gpx version="1.1" creator="gps-tracker" xmlns="http://www.topografix.com/GPX/1/1">\n'
+           f'<trk><name>{escape(name)}</name><trkseg>\n')
+
+    def points():
+        for t, lat, lon, alt, speed, hdop in records:
+            ele = f"<ele>{alt:.1f}</ele>" if alt == alt else ""
+            hdop_tag = f"<hdop>{hdop:.1f}</hdop>" if hdop == hdop else ""
+            yield f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}">{ele}<time>{_iso(t)}</time>{hdop_tag}</trkpt>\n'
+
+    yield from _chunked(points())
+    yield "</trkseg></trk>\n</gpx>\n"
+
+
+def geojson(records):
+    """1本の LineString の Feature。時刻は properties に入れる (ストリームの最後に出力)"""
+    yield '{"type": "Feature", "geometry": {"type": "LineString", "coordinates": ['
+    summary = {"count": 0, "start": None, "end": None}
+
+    def coordinates():
+        for t, lat, lon, alt, speed, hdop in records:
+            sep = "," if summary["count"] else ""
+            if summary["start"] is None:
+                summary["start"] = _iso(t)
+            summary["end"] = t
+            summary["count"] += 1
+            if alt == alt:
+                yield f"{sep}[{lon:.7f},{lat:.7f},{alt:.1f}]"
+            else:
+                yield f"{sep}[{lon:.7f},{lat:.7f}]"
+
+    yield from _chunked(coordinates())
+    if summary["end"] is not None:
+        summary["end"] = _iso(summary["end"])
+    yield f']}}, "properties": {json.dumps(summary)}}}\n'
@@ -0,0 +1,221 @@
+"""ジオフェンス (区域への出入り) の判定
+
+区域は円 (中心 + 半径) と多角形 (外周のみ、穴は扱わない) の2種類。
+全区域を基準緯度 lat0 の平面座標 (メートル) に投影し、一辺 cell_size の格子に登録しておく。
+fix ごとに調べるのはその点を含む格子に登録された区域だけなので、
+区域が数千あっても1点あたりの判定は区域数によらずほぼ一定の時間で済む。
+
+AE-GPS 単体では 30m 程の誤差があり、境界付近では点が内外を行き来する。
+入ったと判定するのは区域の内側に入ったとき、出たと判定するのは境界から margin 以上
+離れたときとし、境界付近のばらつきで enter/exit が繰り返し出ないようにする。
+"""
+import json
+import math
+from threading import Lock
+
+from simplify import EARTH_RADIUS
+
+GEOFENCE_MARGIN = 30.0  # 出たと判定するまでの境界からの距離 (メートル)
+GEOFENCE_CELL_SIZE = 250.0  # 格子の一辺 (メートル)
+
+_K = math.radians(1) * EARTH_RADIUS  # 緯度1度あたりのメートル数
+
+
+class CircleFence:
+    kind = "circle"
+
+    def __init__(self, fence_id, name, lat, lon, radius):
+        self.id = fence_id
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.radius = radius
+
+    def project(self, kx):
+        """平面座標での形と外接矩形を求める (kx: 経度1度あたりのメートル数)"""
+        self._cx = self.lon * kx
+        self._cy = self.lat * _K
+        self._r2 = self.radius * self.radius
+        r = self.radius
+        self.bbox = (self._cx - r, self._cy - r, self._cx + r, self._cy + r)
+
+    def contains(self, x, y):
+        dx = x - self._cx
+        dy = y - self._cy
+        return dx * dx + dy * dy <= self._r2
+
+    def distance(self, x, y):
+        """区域の外の点から境界までの距離 (内側なら 0)"""
+        return max(0.0, math.hypot(x - self._cx, y - self._cy) - self.radius)
+
+    def geometry(self):
+        return {"type": "Point", "coordinates": [self.lon, self.lat]}
+
+
+class PolygonFence:
+    kind = "polygon"
+
+    def __init__(self, fence_id, name, ring):
+        """ring: [(lat, lon), ...] 閉じていなくてもよい"""
+        if ring and ring[0] == ring[-1]:
+            ring = ring[:-1]
+        if len(ring) < 3:
+            raise ValueError(f"区域 {fence_id}: 多角形の頂点が3つ未満です")
+        self.id = fence_id
+        self.name = name
+        self.ring = [(float(lat), float(lon)) for lat, lon in ring]
+
+    def project(self, kx):
+        self._xs = [lon * kx for _, lon in self.ring]
+        self._ys = [lat * _K for lat, _ in self.ring]
+        self.bbox = (min(self._xs), min(self._ys), max(self._xs), max(self._ys))
+
+    def contains(self, x, y):
+        # 交差数判定 (ray casting)
+        xs, ys = self._xs, self._ys
+        inside = False
+        j = len(xs) - 1
+        for i in range(len(xs)):
+            yi, yj = ys[i], ys[j]
+            if (yi > y) != (yj > y) and x < xs[i] + (y - yi) * (xs[j] - xs[i]) / (yj - yi):
+                inside = not inside
+            j = i
+        return inside
+
+    def distance(self, x, y):
+        """区域の外の点から最も近い辺までの距離 (内側でも辺までの距離を返す)"""
+        xs, ys = self._xs, self._ys
+        best = math.inf
+        j = len(xs) - 1
+        for i in range(len(xs)):
+            ax, ay = xs[j], ys[j]
+            dx, dy = xs[i] - ax, ys[i] - ay
+            length2 = dx * dx + dy * dy
+            t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((x - ax) * dx + (y - ay) * dy) / length2))
+            px, py = ax + t * dx - x, ay + t * dy - y
+            best = min(best, px * px + py * py)
+            j = i
+        return math.sqrt(best)
+
+    def geometry(self):
+        coordinates = [[lon, lat] for lat, lon in self.ring]
+        return {"type": "Polygon", "coordinates": [coordinates + coordinates[:1]]}
+
+
+def from_feature(feature, index):
+    """GeoJSON の Feature -> 区域
+
+    Polygon はそのまま、Point は properties.radius (メートル) の円として扱う。
+    区域の ID は properties.id (なければ Feature の id、それもなければ通し番号)。
+    """
+    geometry = feature.get("geometry") or {}
+    properties = feature.get("properties") or {}
+    fence_id = str(properties.get("id", feature.get("id", index)))
+    name = properties.get("name", fence_id)
+    kind = geometry.get("type")
+    if kind == "Point":
+        lon, lat = geometry["coordinates"][:2]
+        if "radius" not in properties:
+            raise ValueError(f"区域 {fence_id}: Point には properties.radius (メートル) が必要です")
+        return CircleFence(fence_id, name, float(lat), float(lon), float(properties["radius"]))
+    if kind == "Polygon":
+        return PolygonFence(fence_id, name, [(lat, lon) for lon, lat, *_ in geometry["coordinates"][0]])
+    raise ValueError(f"区域 {fence_id}: 未対応の形状です: {kind}")
+
+
+def load_geojson(path):
+    """GeoJSON (FeatureCollection) のファイルから区域を読み込む"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    features = data.get("features", []) if data.get("type") == "FeatureCollection" else [data]
+    return [from_feature(feature, i) for i, feature in enumerate(features)]
+
+
+class GeofenceIndex:
+    def __init__(self, fences=(), margin=GEOFENCE_MARGIN, cell_size=GEOFENCE_CELL_SIZE, lat0=None):
+        fences = list(fences)
+        if len({fence.id for fence in fences}) != len(fences):
+            raise ValueError("区域の ID が重複しています")
+        if lat0 is None:
+            lats = [fence.lat if fence.kind == "circle" else fence.ring[0][0] for fence in fences]
+            lat0 = sum(lats) / len(lats) if lats else 0.0
+        self.margin = margin
+        self.cell_size = cell_size
+        self._kx = _K * math.cos(math.radians(lat0))
+        self.fences = {}
+        self._cells = {}  # (列, 行) -> [区域, ...]
+        # 機体ID -> 中にいる区域IDの集合。各機体の状態は機体のスレッドだけが更新する
+        self._inside = {}
+        self._lock = Lock()
+        for fence in fences:
+            self._add(fence)
+
+    def __len__(self):
+        return len(self.fences)
+
+    def _add(self, fence):
+        fence.project(self._kx)
+        self.fences[fence.id] = fence
+        # 出たかどうかの判定のため、外接矩形を margin だけ広げた範囲の格子に登録する
+        x0, y0, x1, y1 = fence.bbox
+        size = self.cell_size
+        for col in range(math.floor((x0 - self.margin) / size), math.floor((x1 + self.margin) / size) + 1):
+            for row in range(math.floor((y0 - self.margin) / size), math.floor((y1 + self.margin) / size) + 1):
+                self._cells.setdefault((col, row), []).append(fence)
+
+    def candidates(self, x, y):
+        """点 (平面座標) の近く (margin 以内) にあり得る区域"""
+        return self._cells.get((math.floor(x / self.cell_size), math.floor(y / self.cell_size)), ())
+
+    def update(self, device_id, lat, lon, t):
+        """機体の新しい fix で出入りを判定し、発生したイベント (dict) のリストを返す"""
+        x = lon * self._kx
+        y = lat * _K
+        with self._lock:
+            inside = self._inside.setdefault(device_id, set())
+        events = []
+        nearby = set()
+        margin = self.margin
+        for fence in self.candidates(x, y):
+            x0, y0, x1, y1 = fence.bbox
+            if x < x0 - margin or x > x1 + margin or y < y0 - margin or y > y1 + margin:
+                continue
+            nearby.add(fence.id)
+            if fence.id in inside:
+                if not fence.contains(x, y) and fence.distance(x, y) >= margin:
+                    inside.discard(fence.id)
+                    events.append(self._event("exit", device_id, fence, lat, lon, t))
+            elif fence.contains(x, y):
+                inside.add(fence.id)
+                events.append(self._event("enter", device_id, fence, lat, lon, t))
+        # 近くにない区域 (margin より外) の中にいたことになっていれば出たとする
+        for fence_id in inside - nearby:
+            inside.discard(fence_id)
+            events.append(self._event("exit", device_id, self.fences[fence_id], lat, lon, t))
+        return events
+
+    def _event(self, kind, device_id, fence, lat, lon, t):
+        return {"type": kind, "device": device_id, "fence": fence.id, "name": fence.name,
+                "time": t, "lat": lat, "lon": lon}
+
+    def occupants(self):
+        """区域ID -> 中にいる機体IDのリスト"""
+        with self._lock:
+            states = [(device_id, set(inside)) for device_id, inside in self._inside.items()]
+        result = {}
+        for device_id, inside in states:
+            for fence_id in inside:
+                result.setdefault(fence_id, []).append(device_id)
+        return result
+
+    def geojson(self):
+        """地図表示用の FeatureCollection (中にいる機体も付ける)"""
+        occupants = self.occupants()
+        features = []
+        for fence in self.fences.values():
+            properties = {"id": fence.id, "name": fence.name, "kind": fence.kind,
+                          "inside": sorted(occupants.get(fence.id, []))}
+            if fence.kind == "circle":
+                properties["radius"] = fence.radius
+            features.append({"type": "Feature", "geometry": fence.geometry(), "properties": properties})
+        return {"type": "FeatureCollection", "features": features}
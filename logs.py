@@ -0,0 +1,55 @@
+"""間引き付きの構造化ログ
+
+1行ごとの print はコンソールが遅い Pi Zero では I/O のコストになるので、
+'event=... key=value ...' 形式のログを、同じ key ごとに interval 秒に1回までに抑える。
+抑えた件数は次に出力するときに suppressed=N として付ける。
+"""
+import logging
+import time
+from threading import Lock
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+
+
+def _format_value(value):
+    text = str(value)
+    if text == "" or any(c in text for c in ' "='):
+        return '"' + text.replace('"', '\\"') + '"'
+    return text
+
+
+def format_event(event, fields):
+    return " ".join([f"event={event}"] + [f"{k}={_format_value(v)}" for k, v in fields.items()])
+
+
+class RateLimitedLogger:
+    def __init__(self, name, interval=5.0):
+        self.logger = logging.getLogger(name)
+        self.interval = interval
+        self._last = {}  # key -> (最後に出力した時刻, 抑えた件数)
+        self._lock = Lock()
+
+    def log(self, level, event, key=None, **fields):
+        """key を指定すると、同じ key のログは interval 秒に1回だけ出力する"""
+        if not self.logger.isEnabledFor(level):
+            return
+        if key is not None:
+            now = time.monotonic()
+            with self._lock:
+                last, suppressed = self._last.get(key, (None, 0))
+                if last is not None and now - last < self.interval:
+                    self._last[key] = (last, suppressed + 1)
+                    return
+                self._last[key] = (now, 0)
+            if suppressed:
+                fields["suppressed"] = suppressed
+        self.logger.log(level, format_event(event, fields))
+
+    def info(self, event, key=None, **fields):
+        self.log(logging.INFO, event, key, **fields)
+
+    def warning(self, event, key=None, **fields):
+        self.log(logging.WARNING, event, key, **fields)
+
+    def debug(self, event, key=None, **fields):
+        self.log(logging.DEBUG, event, key, **fields)
@@ -1,20 +1,100 @@
+import os
 import threading
 import time
-import serial
-import RPi.GPIO as GPIO
-import pynmea2
-from flask import Flask, jsonify, render_template_string, make_response
-from threading import Lock
+# GPS_SIM_GPIO=1 のときだけ模擬GPIO (GPIO18 に 1PPS を模擬) を使う (Raspberry Pi 以外での動作確認用)
+# 実機で RPi.GPIO が壊れているときに模擬の PPS で動き続けないよう、自動では切り替えない
+SIM_GPIO = os.environ.get("GPS_SIM_GPIO") == "1"
+if SIM_GPIO:
+    import sim_gpio as GPIO
+else:
+    import RPi.GPIO as GPIO
+from flask import Flask, Response, g, jsonify, render_template_string, make_response, request
 import atexit
+from urllib.parse import quote
+import logging
+from nmea_ingest import NMEAIngest, epoch_seconds, sentence_type
+import nmea_fast
+from push import EventBroadcaster, FleetBroadcaster
+import tracklog
+from simplify import in_bounds
+import export
+from sources import SourceClosed, parse_sources
+from device import Device
+from datetime import datetime, timezone
+from metrics import REGISTRY, Counter, Gauge, Histogram, InstrumentedLock
+from logs import LOG_FORMAT, RateLimitedLogger
+from pps import PPSClock
+import geofence
 
-# グローバル変数: 生データ, ピン状態, GPS座標, ループ制御フラグ
-raw_data = ""
+# グローバル変数: ピン状態, ループ制御フラグ
 pin_status = {"GPIO14": None, "GPIO15": None, "GPIO18": None}
-gps_data = {"time": None, "lat": None, "lon": None}
 running = True  # 終了制御用グローバルフラグ
 
-# 排他制御用Lock
-data_lock = Lock()
+# 入力元: '<機体ID>=<種類>:<場所>' をカンマ区切りで並べる (環境変数 GPS_SOURCES で上書き可)
+#   serial:/dev/ttyAMA0@9600 / tcp:192.168.0.10:10110 / file:logs/rc1.nmea
+# GPIO18 に 1PPS を接続した受信機の入力元には +pps を付ける (1台だけ)
+# 高速な更新レートで使う場合はボーレートを上げる
+GPS_SOURCES = os.environ.get("GPS_SOURCES", "gps=serial:/dev/ttyAMA0@9600+pps")  # Changed from /dev/ttyS0 based on minicom testing
+RECONNECT_DELAY = 5  # 再接続までの待ち時間 (秒)。失敗が続くと倍々に延ばす
+RECONNECT_MAX_DELAY = 60
+
+# 軌跡の保持件数 (全機体の合計。10Hzで24時間分)
+TRACK_CAPACITY = 10 * 60 * 60 * 24
+TRACK_MAX_POINTS = 5000  # /track が1回に返す最大件数
+
+# fix のディスク保存先 (機体ごとのサブディレクトリに追記専用のバイナリログ)
+TRACKLOG_DIR = 'tracklog'
+TRACKLOG_FLUSH_INTERVAL = 5  # まとめて書き込む間隔 (秒)
+
+KNOTS_TO_MPS = 0.514444
+
+# ジオフェンスの区域 (GeoJSON。Polygon と、properties.radius [m] 付きの Point)。ファイルがなければ判定しない
+GEOFENCE_FILE = os.environ.get("GPS_GEOFENCES", "geofences.json")
+GEOFENCE_MARGIN = 30  # 出たと判定するまでの境界からの距離 (m)。AE-GPS の誤差 (約30m) を吸収する
+
+# ログ: 受信ごとのログは機体・種類ごとに LOG_INTERVAL 秒に1回まで
+LOG_LEVEL = os.environ.get("GPS_LOG_LEVEL", "INFO")
+LOG_INTERVAL = 5
+log = RateLimitedLogger("gps", LOG_INTERVAL)
+
+# /metrics で公開するメトリクス
+PARSE_SECONDS = Histogram("gps_epoch_parse_seconds", "1エポック分の文の解析時間", ["device"])
+EPOCH_SECONDS = Histogram("gps_epoch_handle_seconds", "1エポックの処理時間 (解析・状態更新・配信)", ["device"])
+LOCK_WAIT_SECONDS = Histogram("gps_data_lock_wait_seconds", "data_lock の取得待ち時間", ["device"])
+LOCK_HOLD_SECONDS = Histogram("gps_data_lock_hold_seconds", "data_lock の保持時間", ["device"])
+FIX_LATENCY_SECONDS = Histogram("gps_fix_publish_latency_seconds", "fix の時刻 (PPS基準) から配信までの時間", ["device", "pps"],
+                                buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+HTTP_SECONDS = Histogram("gps_http_request_seconds", "HTTP リクエストの処理時間 (ストリーミングは応答開始まで)",
+                         ["route", "method", "status"])
+GEOFENCE_SECONDS = Histogram("gps_geofence_seconds", "1 fix あたりのジオフェンス判定時間", ["device"])
+GEOFENCE_EVENTS = Counter("gps_geofence_events", "ジオフェンスの出入りイベント数", ["device", "type"])
+READ_ERRORS = Counter("gps_read_errors", "入力元の読み取りエラー数", ["device"])
+STREAM_SUBSCRIBERS = Gauge("gps_stream_subscribers", "接続中の SSE 購読者数").labels()
+
+# 1PPS (GPIO18) の立ち上がりでエポックの時刻を補正する
+# 模擬GPIOの PPS はシステム時計から作ったものなので、PPS 基準 (pps=true) とはしない
+pps_clock = PPSClock(simulated=SIM_GPIO)
+
+# /status の内容を fix ごとに1回だけ組み立て、SSE / long-poll の購読者へ配る
+fleet = FleetBroadcaster()
+LONG_POLL_TIMEOUT = 25  # long-poll の最大待ち時間 (秒)
+
+# ジオフェンスの判定と、出入りイベントの配信
+geofences = geofence.GeofenceIndex(
+    geofence.load_geojson(GEOFENCE_FILE) if os.path.exists(GEOFENCE_FILE) else (), margin=GEOFENCE_MARGIN)
+geofence_events = EventBroadcaster()
+
+# 機体ごとの状態 (機体ID -> Device)。先頭の機体が機体ID省略時の既定
+sources = parse_sources(GPS_SOURCES)
+devices = {
+    source.device_id: Device(source.device_id, fleet.device(source.device_id),
+                             TRACK_CAPACITY // len(sources), TRACKLOG_DIR,
+                             InstrumentedLock(LOCK_WAIT_SECONDS.labels(source.device_id),
+                                              LOCK_HOLD_SECONDS.labels(source.device_id)),
+                             pps=source.pps)
+    for source in sources
+}
+default_device = next(iter(devices.values()))
 
 # GPIO初期化
 def setup_gpio():
@@ -22,6 +102,10 @@ def setup_gpio():
     GPIO.setwarnings(False)
     # 1PPS入力用: GPIO18
     GPIO.setup(18, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    # 1PPS の立ち上がりごとに時刻の基準を取る
+    GPIO.add_event_detect(18, GPIO.RISING, callback=pps_clock.on_edge)
+    if SIM_GPIO:
+        log.warning("sim_gpio", detail="模擬GPIOで動作中。1PPS はシステム時計からの模擬")
     print("GPIOの初期化完了")
 
 # Register GPIO cleanup for program exit
@@ -30,66 +114,140 @@ def cleanup():
     GPIO.cleanup()
 atexit.register(cleanup)
 
-# シリアルポート接続
-def connect_serial():
+# 入力元への接続
+def connect_source(source):
     try:
-        ser = serial.Serial(
-            port='/dev/ttyAMA0',  # Changed from /dev/ttyS0 based on minicom testing
-            baudrate=9600,
-            timeout=1,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            bytesize=serial.EIGHTBITS
-        )
-        print("シリアルポート接続成功")
-        return ser
+        port = source.open()
+        log.info("connected", device=source.device_id, source=source)
+        return port
     except Exception as e:
-        print(f"シリアル接続エラー: {e}")
+        log.warning("connect_error", key=(source.device_id, "connect_error"), device=source.device_id, error=e)
         return None
 
-def read_raw_data():
-    global gps_data, raw_data, running
+# 1エポック分の文を解析し、機体の状態を更新する
+def handle_epoch(device, epoch):
+    started = time.perf_counter()
+    new_gps = {}
+    for sentence in epoch:
+        # GGA/RMC はトーカーID ($GP/$GN/$GL ...) を問わず高速デコーダで解析する
+        if sentence_type(sentence) not in (b"GGA", b"RMC"):
+            continue
+        fix = nmea_fast.decode(sentence)
+        if fix is None:
+            continue
+        valid = fix.quality > 0 if isinstance(fix, nmea_fast.GGAFix) else fix.valid
+        # 有効な fix がある場合のみ更新する（緯度・経度が空でない場合）
+        if valid and fix.lat and fix.lon:
+            new_gps.update({"time": fix.time, "lat": fix.lat, "lon": fix.lon})
+            # 高度・HDOPは GGA から、速度は RMC から取る
+            if isinstance(fix, nmea_fast.GGAFix):
+                new_gps.update({"alt": fix.alt, "hdop": fix.hdop})
+            elif fix.speed_knots is not None:
+                new_gps["speed"] = fix.speed_knots * KNOTS_TO_MPS
+        else:
+            log.info("no_fix", key=(device.device_id, "no_fix"), device=device.device_id)
+    PARSE_SECONDS.labels(device.device_id).observe(time.perf_counter() - started)
+    # エポックの時刻: PPS を接続した受信機なら NMEA時刻の秒の PPS + 秒未満、それ以外は受信した時刻
+    if device.pps:
+        fix_time, fix_pps = pps_clock.epoch_time(epoch_seconds(epoch))
+    else:
+        fix_time, fix_pps = time.time(), False
+    with device.data_lock:
+        # raw_data は常に更新 (エポックの最後の文)
+        device.raw_data = epoch[-1].decode('ascii', errors='replace')
+        # 有効なGPSデータがあれば更新、無効な場合はそのままとする
+        if new_gps:
+            device.gps_data.update(new_gps)
+            device.fix_time = fix_time
+            device.fix_pps = fix_pps
+    if new_gps:
+        fix_row = (fix_time, new_gps["lat"], new_gps["lon"],
+                   new_gps.get("alt"), new_gps.get("speed"), new_gps.get("hdop"))
+        device.track.append(*fix_row)
+        device.tracklog_writer.append(*fix_row)
+        check_geofences(device, fix_row)
+    device.broadcaster.publish(status_snapshot(device))
+    if new_gps:
+        FIX_LATENCY_SECONDS.labels(device.device_id, str(fix_pps).lower()).observe(time.time() - fix_time)
+    EPOCH_SECONDS.labels(device.device_id).observe(time.perf_counter() - started)
+    log.info("epoch", key=(device.device_id, "epoch"), device=device.device_id,
+             sentences=len(epoch), raw=device.raw_data)
+
+# 新しい fix で区域への出入りを判定し、イベントを配信する
+def check_geofences(device, fix_row):
+    if not len(geofences):
+        return
+    started = time.perf_counter()
+    events = geofences.update(device.device_id, fix_row[1], fix_row[2], fix_row[0])
+    GEOFENCE_SECONDS.labels(device.device_id).observe(time.perf_counter() - started)
+    for event in events:
+        geofence_events.publish(event)
+        GEOFENCE_EVENTS.labels(device.device_id, event["type"]).inc()
+        log.info("geofence", device=device.device_id, type=event["type"], fence=event["fence"], name=event["name"])
+
+# 入力元1つ分の読み込みループ (入力元ごとに1スレッド)
+def read_raw_data(source, device):
+    delay = RECONNECT_DELAY
     while running:
-        ser = connect_serial()
-        if not ser:
-            print("シリアル接続に失敗。5秒後に再試行します。")
-            time.sleep(5)
+        port = connect_source(source)
+        if not port:
+            log.warning("reconnect_wait", key=(source.device_id, "reconnect_wait"), device=source.device_id, delay=delay)
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
             continue
+        ingest = NMEAIngest(device.ingest_stats)
+        device.connected = True
+        device.broadcaster.publish(status_snapshot(device))
         try:
             while running:
                 try:
-                    line = ser.readline()
-                    if line:
-                        decoded_line = line.decode('utf-8', errors='replace').strip()
-                        new_gps = {}
-                        if decoded_line.startswith("$GPGGA"):
-                            try:
-                                msg = pynmea2.parse(decoded_line)
-                                # 有効な fix がある場合のみ更新する（緯度・経度が空でない場合）
-                                if msg.lat and msg.lon and float(msg.latitude) != 0 and float(msg.longitude) != 0:
-                                    new_gps = {
-                                        "time": str(msg.timestamp),
-                                        "lat": float(msg.latitude),
-                                        "lon": float(msg.longitude)
-                                    }
-                                else:
-                                    print("Fixが取得できていないか、無効な値です。")
-                            except Exception as parse_err:
-                                print(f"NMEA解析エラー (GPGGA): {parse_err}")
-                        with data_lock:
-                            # raw_data は常に更新
-                            raw_data = decoded_line
-                            # 有効なGPSデータがあれば更新、無効な場合はそのままとする
-                            if new_gps:
-                                gps_data.update(new_gps)
-                        print(f"受信: {decoded_line}")
+                    # 受信済みのデータをまとめて読み、確定したエポックごとに処理する
+                    for epoch in ingest.poll(port):
+                        handle_epoch(device, epoch)
+                        # データが届いたら再接続の待ち時間を戻す
+                        delay = RECONNECT_DELAY
+                except SourceClosed as e:
+                    log.info("source_closed", device=source.device_id, reason=e)
+                    for epoch in ingest.finish():
+                        handle_epoch(device, epoch)
+                    break
+                except OSError as e:
+                    # serial.SerialException も OSError の一種
+                    READ_ERRORS.labels(source.device_id).inc()
+                    log.warning("read_error", key=(source.device_id, "read_error"), device=source.device_id, error=e)
+                    break
                 except Exception as e:
-                    print(f"読み取りエラー: {e}")
-                time.sleep(1)
+                    READ_ERRORS.labels(source.device_id).inc()
+                    log.warning("read_error", key=(source.device_id, "read_error"), device=source.device_id, error=e)
         finally:
-            ser.close()
-            print("シリアルポートをクローズしました")
-        time.sleep(5)
+            port.close()
+            device.connected = False
+            device.broadcaster.publish(status_snapshot(device))
+            log.info("disconnected", device=source.device_id)
+        if not source.reconnect:
+            return
+        time.sleep(delay)
+        delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+# ログの書き込みは一定間隔でまとめて行う (fsync は flush ごとに1回)
+def flush_tracklog():
+    while running:
+        time.sleep(TRACKLOG_FLUSH_INTERVAL)
+        for device in devices.values():
+            try:
+                device.tracklog_writer.flush()
+            except OSError as e:
+                log.warning("tracklog_error", key=(device.device_id, "tracklog_error"), device=device.device_id, error=e)
+
+# 起動時: 前回までのログから軌跡のリングバッファを埋め直す
+def restore_track():
+    for device in devices.values():
+        count = 0
+        seconds = device.track.capacity / 10
+        for record in tracklog.seconds_ago(device.tracklog_dir, seconds):
+            device.track.append(*(None if v != v else v for v in record))
+            count += 1
+        log.info("track_restored", device=device.device_id, records=count)
 
 # Flaskアプリケーション
 app = Flask(__name__)
@@ -97,15 +255,230 @@ app = Flask(__name__)
 DEFAULT_LAT = 35.681236
 DEFAULT_LON = 139.767125
 
-@app.route("/status", methods=["GET"])
-def get_status():
-    with data_lock:
+# /status 用の現在状態 (data_lock を取って組み立てる)
+def status_snapshot(device):
+    with device.data_lock:
+        gps_data = device.gps_data
         data = {
+            "device": device.device_id,
+            "connected": device.connected,
             "time": gps_data["time"] if gps_data["time"] is not None else "",
             "lat": gps_data["lat"] if gps_data["lat"] is not None else DEFAULT_LAT,
             "lon": gps_data["lon"] if gps_data["lon"] is not None else DEFAULT_LON,
-            "raw": raw_data if raw_data != "" else ""
+            "raw": device.raw_data if device.raw_data != "" else "",
+            "fix_time": device.fix_time,
+            "pps": device.fix_pps,
+            "ingest": dict(device.ingest_stats)
         }
+    data["track_seq"] = device.track.next_seq
+    return data
+
+for _device in devices.values():
+    _device.broadcaster.publish(status_snapshot(_device))
+
+# ?device=<機体ID> で対象の機体を選ぶ (省略時は先頭の機体)
+def request_device():
+    device_id = request.args.get("device")
+    if device_id is None:
+        return default_device
+    return devices.get(device_id)
+
+def unknown_device():
+    return jsonify({"error": f"機体 {request.args.get('device')!r} はありません", "devices": list(devices)}), 404
+
+def status_response(version, body):
+    # 内容が変わっていなければ 304 を返せるよう版数を ETag にする
+    if request.if_none_match.contains(str(version)):
+        response = make_response("", 304)
+    else:
+        response = make_response(body)
+        response.mimetype = "application/json"
+    response.set_etag(str(version))
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# リクエストごとの処理時間
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request_time(response):
+    started = getattr(g, "request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        HTTP_SECONDS.labels(route, request.method, response.status_code).observe(time.perf_counter() - started)
+    return response
+
+# 出力のたびに各機体の状態から集めるメトリクス
+@REGISTRY.add_collector
+def collect_device_metrics():
+    now = time.time()
+    ingest_counters = {
+        "bytes_read": "受信バイト数",
+        "sentences": "チェックサムの正しい文の数",
+        "checksum_errors": "チェックサム不一致の文の数",
+        "overruns": "受信バッファあふれ・改行なしで破棄した回数",
+        "epochs": "確定したエポック数",
+    }
+    families = []
+    for key, help_text in ingest_counters.items():
+        samples = [("_total", {"device": d.device_id}, d.ingest_stats[key]) for d in devices.values()]
+        families.append((f"gps_ingest_{key}", "counter", help_text, samples))
+    gauges = (
+        ("gps_ingest_rx_waiting_bytes", "最後の読み出し時に OS の受信バッファに溜まっていたバイト数",
+         lambda d: d.ingest_stats.get("rx_waiting", 0)),
+        ("gps_tracklog_pending_records", "ディスクへの書き込み待ちの fix 数", lambda d: d.tracklog_writer.pending()),
+        ("gps_track_records", "軌跡のリングバッファに保持している fix 数", lambda d: len(d.track)),
+        ("gps_fix_age_seconds", "最新の fix の時刻からの経過時間",
+         lambda d: now - d.fix_time if d.fix_time is not None else float("nan")),
+        ("gps_source_connected", "入力元に接続中なら 1", lambda d: int(d.connected)),
+    )
+    for name, help_text, func in gauges:
+        families.append((name, "gauge", help_text, [("", {"device": d.device_id}, func(d)) for d in devices.values()]))
+    families.append(("gps_geofences", "gauge", "登録されているジオフェンスの区域数", [("", {}, len(geofences))]))
+    edge = pps_clock.last_edge
+    families.append(("gps_pps_edges", "counter", "1PPS の立ち上がりの数", [("_total", {}, pps_clock.edges)]))
+    families.append(("gps_pps_age_seconds", "gauge", "最後の 1PPS からの経過時間",
+                     [("", {}, now - edge if edge is not None else float("nan"))]))
+    return families
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+def fleet_body(version, bodies):
+    return '{"version": %d, "devices": [%s]}' % (version, ", ".join(bodies))
+
+# 全機体の一覧と最新状態
+@app.route("/devices", methods=["GET"])
+def get_devices():
+    version, bodies = fleet.wait(0, 0)
+    return status_response(version, fleet_body(version, bodies))
+
+@app.route("/status", methods=["GET"])
+def get_status():
+    device = request_device()
+    if device is None:
+        return unknown_device()
+    return status_response(*device.broadcaster.latest())
+
+# long-poll: /status/wait?device=<機体ID>&version=<手元の版数> 新しい版が出るまで待って返す
+@app.route("/status/wait", methods=["GET"])
+def wait_status():
+    device = request_device()
+    if device is None:
+        return unknown_device()
+    after = request.args.get("version", default=0, type=int)
+    timeout = min(request.args.get("timeout", default=LONG_POLL_TIMEOUT, type=float), LONG_POLL_TIMEOUT)
+    return status_response(*device.broadcaster.wait(after, timeout))
+
+# 全機体分の long-poll: /fleet/wait?version=<手元の通し番号> 前回以降に更新された機体だけを返す
+@app.route("/fleet/wait", methods=["GET"])
+def wait_fleet():
+    after = request.args.get("version", default=0, type=int)
+    timeout = min(request.args.get("timeout", default=LONG_POLL_TIMEOUT, type=float), LONG_POLL_TIMEOUT)
+    version, bodies = fleet.wait(after, timeout)
+    return status_response(version, fleet_body(version, bodies))
+
+def count_subscriber(events):
+    STREAM_SUBSCRIBERS.inc()
+    try:
+        yield from events
+    finally:
+        STREAM_SUBSCRIBERS.dec()
+
+# SSE: 新しい状態が出るたびに全購読者へ1回ずつ送る
+# ?device=<機体ID> ならその機体だけ、省略時は全機体 (更新された機体ごとに1イベント)
+@app.route("/stream", methods=["GET"])
+def stream_status():
+    after = request.headers.get("Last-Event-ID", default=0, type=int)
+    if "device" in request.args:
+        device = request_device()
+        if device is None:
+            return unknown_device()
+        events = device.broadcaster.stream(after, should_run=lambda: running)
+    else:
+        events = fleet.stream(after, should_run=lambda: running)
+    response = Response(count_subscriber(events), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+# ジオフェンスの出入りイベントの SSE。再接続時は Last-Event-ID (または ?since=) 以降を送り直す
+@app.route("/events", methods=["GET"])
+def stream_events():
+    after = request.headers.get("Last-Event-ID", default=request.args.get("since", default=0, type=int), type=int)
+    events = geofence_events.stream(after, should_run=lambda: running)
+    response = Response(count_subscriber(events), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+# long-poll 版: /events/wait?since=<前回の last_id>
+@app.route("/events/wait", methods=["GET"])
+def wait_events():
+    after = request.args.get("since", default=0, type=int)
+    timeout = min(request.args.get("timeout", default=LONG_POLL_TIMEOUT, type=float), LONG_POLL_TIMEOUT)
+    last_id, events = geofence_events.wait(after, timeout)
+    body = '{"last_id": %d, "events": [%s]}' % (last_id, ", ".join(e for _, e in events))
+    return Response(body, mimetype="application/json")
+
+# 地図表示用の区域 (GeoJSON)。properties.inside に中にいる機体
+@app.route("/fences", methods=["GET"])
+def get_fences():
+    return jsonify(geofences.geojson())
+
+# 軌跡の差分取得: /track?device=<機体ID>&since=<前回の next>
+@app.route("/track", methods=["GET"])
+def get_track():
+    device = request_device()
+    if device is None:
+        return unknown_device()
+    since = request.args.get("since", default=0, type=int)
+    start, end, columns = device.track.since(since, limit=TRACK_MAX_POINTS)
+    data = {
+        "device": device.device_id,
+        "from": start,
+        "next": end,
+        # 要求した seq が既に上書きされていた場合、クライアントは軌跡を描き直す
+        "reset": start != since,
+        "more": end < device.track.next_seq,
+    }
+    for name, values in columns.items():
+        # 欠損値 (NaN) は JSON では null にする
+        data[name] = [None if v != v else v for v in values]
+    response = make_response(jsonify(data))
+    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    return response
+
+# ズームに合わせて間引いた軌跡: /track/simplified?device=<機体ID>&zoom=15&bbox=west,south,east,north
+# start/end (UNIX時刻) で範囲を絞れる。next 以降は /track の差分で延ばす
+@app.route("/track/simplified", methods=["GET"])
+def get_simplified_track():
+    device = request_device()
+    if device is None:
+        return unknown_device()
+    zoom = max(0, min(request.args.get("zoom", default=15, type=int), 22))
+    start = request.args.get("start", type=float)
+    end = request.args.get("end", type=float)
+    seqs, lat, lon, next_seq = device.simplified_track.get(zoom, start, end)
+    bbox = request.args.get("bbox")
+    if bbox:
+        try:
+            west, south, east, north = (float(v) for v in bbox.split(","))
+        except ValueError:
+            return jsonify({"error": "bbox は west,south,east,north で指定してください"}), 400
+        mask = in_bounds(lat, lon, south, west, north, east)
+        lat, lon = lat[mask], lon[mask]
+    data = {
+        "device": device.device_id,
+        "zoom": zoom,
+        "next": next_seq,
+        "count": len(lat),
+        "lat": lat.tolist(),
+        "lon": lon.tolist(),
+    }
     response = make_response(jsonify(data))
     response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
     return response
@@ -131,10 +504,13 @@ def index():
   </head>
   <body>
     <div id="info">
+      <p>Device: <select id="device"></select></p>
       <p>Time: <span id="time">---</span></p>
       <p>Latitude: <span id="lat">---</span></p>
       <p>Longitude: <span id="lon">---</span></p>
       <p>Raw Data: <span id="raw">---</span></p>
+      <p>Latency: <span id="latency">---</span></p>
+      <p>Geofence: <span id="geofence">---</span></p>
     </div>
     <div id="map"></div>
     <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js" crossorigin=""></script>
@@ -146,36 +522,273 @@ def index():
           maxZoom: 19,
           attribution: '© OpenStreetMap'
       }).addTo(map);
-      var marker = L.marker([defaultLat, defaultLon]).addTo(map);
-      
-      function updateData() {
-          fetch('/status?ts=' + new Date().getTime())
+      var colors = ['red', 'blue', 'green', 'orange', 'purple', 'brown', 'black', 'magenta'];
+      // 機体ごとのマーカーと軌跡 (機体ID -> {marker, trail, trackSeq, ...})
+      var devices = {};
+      var selector = document.getElementById('device');
+      var followId = null;  // 地図の中心に表示する機体
+
+      function getDevice(id) {
+          if (!devices[id]) {
+              var color = colors[Object.keys(devices).length % colors.length];
+              devices[id] = {
+                  id: id,
+                  marker: L.marker([defaultLat, defaultLon]).bindTooltip(id, {permanent: true}).addTo(map),
+                  // 軌跡: 前回以降の差分だけを取得してポリラインを延ばす
+                  trail: L.polyline([], {color: color}).addTo(map),
+                  trackSeq: 0,
+                  trackBusy: false,  // 取得中に次の取得を重ねない
+                  loadedBounds: null,
+                  last: null
+              };
+              var option = document.createElement('option');
+              option.value = id;
+              option.text = id;
+              selector.add(option);
+              if (followId === null) {
+                  followId = id;
+              }
+              loadSimplified(devices[id]);
+          }
+          return devices[id];
+      }
+
+      selector.onchange = function() {
+          followId = selector.value;
+          if (devices[followId].last) {
+              showStatus(devices[followId].last);
+          }
+      };
+
+      function updateTrack(d) {
+          if (d.trackBusy) {
+              return;
+          }
+          d.trackBusy = true;
+          fetch('/track?device=' + encodeURIComponent(d.id) + '&since=' + d.trackSeq)
           .then(response => response.json())
           .then(data => {
-              console.log("Fetched status data:", data);
-              var lat = data.lat;
-              var lon = data.lon;
-              marker.setLatLng([lat, lon]);
-              map.setView([lat, lon]);
-              document.getElementById('time').innerText = data.time || '---';
-              document.getElementById('lat').innerText = data.lat ? parseFloat(data.lat).toFixed(6) : '---';
-              document.getElementById('lon').innerText = data.lon ? parseFloat(data.lon).toFixed(6) : '---';
-              document.getElementById('raw').innerText = data.raw || '---';
+              if (data.reset) {
+                  d.trail.setLatLngs([]);
+              }
+              for (var i = 0; i < data.lat.length; i++) {
+                  d.trail.addLatLng([data.lat[i], data.lon[i]]);
+              }
+              d.trackSeq = data.next;
+              d.trackBusy = false;
+              if (data.more) {
+                  updateTrack(d);
+              }
+          })
+          .catch(() => { d.trackBusy = false; });
+      }
+
+      // ズーム変更時などは、ズームに合わせて間引いた軌跡を表示範囲(の周辺)だけ取り直す
+      function loadSimplified(d) {
+          if (d.trackBusy) {
+              return;
+          }
+          d.trackBusy = true;
+          var bounds = map.getBounds().pad(1);
+          fetch('/track/simplified?device=' + encodeURIComponent(d.id) + '&zoom=' + map.getZoom() + '&bbox=' + bounds.toBBoxString())
+          .then(response => response.json())
+          .then(data => {
+              d.trail.setLatLngs(data.lat.map((lat, i) => [lat, data.lon[i]]));
+              d.trackSeq = data.next;
+              d.loadedBounds = bounds;
+              d.trackBusy = false;
+          })
+          .catch(() => { d.trackBusy = false; });
+      }
+
+      map.on('zoomend', function() {
+          Object.values(devices).forEach(loadSimplified);
+      });
+      map.on('moveend', function() {
+          Object.values(devices).forEach(d => {
+              if (d.loadedBounds && !d.loadedBounds.contains(map.getBounds())) {
+                  loadSimplified(d);
+              }
           });
+      });
+
+      // ジオフェンス: 区域を描き、中に機体がいる区域を塗りつぶす
+      var fences = {};  // 区域ID -> {layer, inside: {機体ID: true}}
+
+      function styleFence(f) {
+          var occupied = Object.keys(f.inside).length > 0;
+          f.layer.setStyle({color: occupied ? 'red' : 'gray', weight: 2, fillOpacity: occupied ? 0.3 : 0.05});
       }
-      
-      updateData();
-      setInterval(updateData, 2000);
+
+      fetch('/fences')
+      .then(response => response.json())
+      .then(data => {
+          data.features.forEach(feature => {
+              var p = feature.properties;
+              var c = feature.geometry.coordinates;
+              var layer = p.kind === 'circle'
+                  ? L.circle([c[1], c[0]], {radius: p.radius})
+                  : L.polygon(c[0].map(v => [v[1], v[0]]));
+              var f = {layer: layer.bindTooltip(p.name).addTo(map), inside: {}};
+              p.inside.forEach(id => { f.inside[id] = true; });
+              fences[p.id] = f;
+              styleFence(f);
+          });
+      });
+
+      function showFenceEvent(event) {
+          var f = fences[event.fence];
+          if (f) {
+              if (event.type === 'enter') {
+                  f.inside[event.device] = true;
+              } else {
+                  delete f.inside[event.device];
+              }
+              styleFence(f);
+          }
+          var when = new Date(event.time * 1000).toLocaleTimeString();
+          document.getElementById('geofence').innerText =
+              when + ' ' + event.device + (event.type === 'enter' ? ' → ' : ' ← ') + event.name;
+      }
+
+      var eventId = 0;
+
+      function pollEvents() {
+          fetch('/events/wait?since=' + eventId)
+          .then(response => response.json())
+          .then(data => {
+              eventId = data.last_id;
+              data.events.forEach(showFenceEvent);
+              pollEvents();
+          })
+          .catch(() => { setTimeout(pollEvents, 2000); });
+      }
+
+      if (window.EventSource) {
+          new EventSource('/events').onmessage = function(event) {
+              showFenceEvent(JSON.parse(event.data));
+          };
+      } else {
+          fetch('/events/wait?timeout=0')
+          .then(response => response.json())
+          .then(data => { eventId = data.last_id; pollEvents(); });
+      }
+
+      var fleetVersion = 0;
+
+      function showStatus(data) {
+          var d = getDevice(data.device);
+          d.last = data;
+          d.marker.setLatLng([data.lat, data.lon]);
+          // 軌跡に新しい点があるときだけ差分を取りに行く
+          if (data.track_seq > d.trackSeq) {
+              updateTrack(d);
+          }
+          if (data.device !== followId) {
+              return;
+          }
+          console.log("Fetched status data:", data);
+          map.setView([data.lat, data.lon]);
+          document.getElementById('time').innerText = data.time || '---';
+          document.getElementById('lat').innerText = data.lat ? parseFloat(data.lat).toFixed(6) : '---';
+          document.getElementById('lon').innerText = data.lon ? parseFloat(data.lon).toFixed(6) : '---';
+          document.getElementById('raw').innerText = (data.connected ? '' : '[切断中] ') + (data.raw || '---');
+          // fix の時刻 (PPS基準) から表示までの遅れ。端末とサーバの時計が合っている前提
+          if (data.fix_time) {
+              var latency = Date.now() / 1000 - data.fix_time;
+              document.getElementById('latency').innerText = (latency * 1000).toFixed(0) + ' ms' + (data.pps ? ' (PPS)' : '');
+          }
+      }
+
+      // long-poll: いずれかの機体が更新されるまでサーバ側で待ってもらう
+      function pollFleet() {
+          fetch('/fleet/wait?version=' + fleetVersion)
+          .then(response => response.json())
+          .then(data => {
+              fleetVersion = data.version;
+              data.devices.forEach(showStatus);
+              pollFleet();
+          })
+          .catch(() => { setTimeout(pollFleet, 2000); });
+      }
+
+      fetch('/devices')
+      .then(response => response.json())
+      .then(data => {
+          data.devices.forEach(showStatus);
+          if (window.EventSource) {
+              // SSE: いずれかの機体に新しい fix が出るたびにサーバから送られてくる (切断時は自動で再接続)
+              var source = new EventSource('/stream');
+              source.onmessage = function(event) {
+                  showStatus(JSON.parse(event.data));
+              };
+          } else {
+              fleetVersion = data.version;
+              pollFleet();
+          }
+      });
     </script>
   </body>
 </html>
 """)
 
+# 時刻の指定: UNIX時刻 (秒) または ISO 8601
+def parse_time_arg(name, default):
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        # オフセットなしは UTC とみなす (サーバのローカル時刻にはしない)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+def export_response(generator, mimetype, filename):
+    response = Response(generator, mimetype=mimetype)
+    # 機体IDに記号や日本語が含まれてもよいよう、filename は引用し、filename* に UTF-8 でも入れる
+    fallback = filename.encode("ascii", "replace").decode().replace("\\", "_").replace('"', "_")
+    response.headers["Content-Disposition"] = f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename)}'
+    return response
+
+# ログの書き出し: /export.gpx?device=<機体ID>&start=...&end=... (ストリーミングで返す)
+@app.route("/export.gpx", methods=["GET"])
+def export_gpx():
+    device = request_device()
+    if device is None:
+        return unknown_device()
+    try:
+        start = parse_time_arg("start", 0.0)
+        end = parse_time_arg("end", time.time())
+    except ValueError:
+        return jsonify({"error": "start/end は UNIX時刻 または ISO 8601 で指定してください"}), 400
+    records = tracklog.query(device.tracklog_dir, start, end)
+    return export_response(export.gpx(records, name=device.device_id), "application/gpx+xml",
+                           f"{device.device_id}.gpx")
+
+@app.route("/export.geojson", methods=["GET"])
+def export_geojson():
+    device = request_device()
+    if device is None:
+        return unknown_device()
+    try:
+        start = parse_time_arg("start", 0.0)
+        end = parse_time_arg("end", time.time())
+    except ValueError:
+        return jsonify({"error": "start/end は UNIX時刻 または ISO 8601 で指定してください"}), 400
+    records = tracklog.query(device.tracklog_dir, start, end)
+    return export_response(export.geojson(records), "application/geo+json", f"{device.device_id}.geojson")
+
 @app.route("/display")
 def display():
-    with data_lock:
-        lat = gps_data.get("lat")
-        lon = gps_data.get("lon")
+    device = request_device()
+    if device is None:
+        return unknown_device()
+    with device.data_lock:
+        lat = device.gps_data.get("lat")
+        lon = device.gps_data.get("lon")
     return render_template_string("""
 <html>
   <head>
@@ -190,15 +803,25 @@ def display():
 </html>""", lat=lat, lon=lon)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
     setup_gpio()
-    # raw_data 読み込みスレッドを開始
-    raw_data_thread = threading.Thread(target=read_raw_data)
-    raw_data_thread.daemon = True
-    raw_data_thread.start()
+    restore_track()
+    # ログ書き込みスレッドを開始
+    flush_thread = threading.Thread(target=flush_tracklog)
+    flush_thread.daemon = True
+    flush_thread.start()
+    # 入力元ごとに読み込みスレッドを開始 (1台が止まっても他の機体に影響しない)
+    for source in sources:
+        raw_data_thread = threading.Thread(target=read_raw_data, args=(source, devices[source.device_id]),
+                                           name=f"source-{source.device_id}")
+        raw_data_thread.daemon = True
+        raw_data_thread.start()
     try:
-        app.run(debug=False, host='0.0.0.0', port=7777, use_reloader=False)
+        app.run(debug=False, host='0.0.0.0', port=7777, use_reloader=False, threaded=True)
     except KeyboardInterrupt:
         print("KeyboardInterrupt を検知しました。終了処理を実行します。")
     finally:
         running = False
-        print("アプリケーションを終了します。")
\ No newline at end of file
+        for device in devices.values():
+            device.tracklog_writer.close()
+        print("アプリケーションを終了します。")
@@ -0,0 +1,228 @@
+"""/metrics で公開する実行時メトリクス (Prometheus のテキスト形式)
+
+依存を増やさないよう、Counter / Gauge / Histogram と出力処理だけを自前で持つ。
+ラベルごとの子オブジェクトは labels() で一度取り出して使い回せば、
+計測のたびにかかるのは辞書1回の参照とロック1回だけで済む。
+"""
+import math
+import time
+from bisect import bisect_left
+from threading import Lock
+
+# 処理時間用の既定のバケット (秒)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value != value:
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, func):
+        """出力のたびに呼ばれる関数を登録する。(名前, 型, 説明, [(接尾辞, ラベル, 値), ...]) を返すこと"""
+        with self._lock:
+            self._collectors.append(func)
+        return func
+
+    def render(self):
+        with self._lock:
+            families = [m.collect() for m in self._metrics]
+            collectors = list(self._collectors)
+        for func in collectors:
+            families.extend(func())
+        lines = []
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = Lock()
+        registry.register(self)
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ラベルは {self.labelnames} です")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self):
+        samples = []
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            labels = dict(zip(self.labelnames, key))
+            samples.extend(child.samples(labels))
+        return self.name, self.kind, self.help, samples
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0
+        self._lock = Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def samples(self, labels):
+        return [("_total", labels, self._value)]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._func = None
+        self._lock = Lock()
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def set_function(self, func):
+        """出力のたびに func() の値を使う"""
+        self._func = func
+
+    def samples(self, labels):
+        return [("", labels, self._func() if self._func else self._value)]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value):
+        i = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, labels):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self._buckets + (math.inf,), counts):
+            cumulative += count
+            samples.append(("_bucket", dict(labels, le=_format_value(float(bound))), cumulative))
+        samples.append(("_sum", labels, total))
+        samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class _Timer:
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+class InstrumentedLock:
+    """Lock の取得待ち時間と保持時間をヒストグラムに記録する (with 文で使う)"""
+
+    def __init__(self, wait_histogram, hold_histogram):
+        self._lock = Lock()
+        self._wait = wait_histogram
+        self._hold = hold_histogram
+        self._acquired_at = 0.0
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self._lock.acquire()
+        self._acquired_at = time.perf_counter()
+        self._wait.observe(self._acquired_at - start)
+        return self
+
+    def __exit__(self, *exc):
+        held = time.perf_counter() - self._acquired_at
+        self._lock.release()
+        self._hold.observe(held)
@@ -0,0 +1,107 @@
+"""よく使うNMEA文 (GGA/RMC/VTG/GSA) の高速デコーダ
+
+pynmea2.parse は汎用オブジェクトを組み立てるため、高い更新レートでは
+Pi Zero 2 W のCPUを食いつぶす。ここでは bytes から直接フィールドを取り出し、
+軽量な namedtuple にする。対象外の文は pynmea2 に任せる。
+
+トーカーIDは問わない ($GP/$GN/$GL/$GA/$GB ...)。
+チェックサムは取り込み側 (nmea_ingest) で検証済みの前提。
+"""
+from collections import namedtuple
+
+import pynmea2
+
+GGAFix = namedtuple("GGAFix", "talker time lat lon quality num_sats hdop alt")
+RMCFix = namedtuple("RMCFix", "talker time valid lat lon speed_knots course date")
+VTGFix = namedtuple("VTGFix", "talker course speed_knots speed_kmh")
+GSAFix = namedtuple("GSAFix", "talker mode fix_type sats pdop hdop vdop")
+
+
+def _float(field):
+    return float(field) if field else None
+
+
+def _int(field):
+    return int(field) if field else None
+
+
+def _time(field):
+    """b'123519.50' -> '12:35:19.500000+00:00' (pynmea2 の str(msg.timestamp) と同じ形式)"""
+    if len(field) < 6:
+        return None
+    s = field.decode()
+    text = s[0:2] + ":" + s[2:4] + ":" + s[4:6]
+    # 小数部は float を経由せず、文字列のまま6桁 (マイクロ秒) に揃える
+    frac = s[7:13]
+    if frac.strip("0"):
+        text += "." + frac.ljust(6, "0")
+    return text + "+00:00"
+
+
+def _coord(value, hemi, deg_len):
+    """ddmm.mmmm + N/S (dddmm.mmmm + E/W) -> 10進の度"""
+    if not value:
+        return None
+    deg = int(value[:deg_len]) + float(value[deg_len:]) / 60.0
+    return -deg if hemi in (b"S", b"W") else deg
+
+
+def _body(sentence):
+    star = sentence.rfind(b"*")
+    return sentence[1:star] if star > 0 else sentence[1:]
+
+
+def _gga(talker, f):
+    return GGAFix(talker, _time(f[1]), _coord(f[2], f[3], 2), _coord(f[4], f[5], 3),
+                  _int(f[6]) or 0, _int(f[7]), _float(f[8]), _float(f[9]))
+
+
+def _rmc(talker, f):
+    return RMCFix(talker, _time(f[1]), f[2] == b"A", _coord(f[3], f[4], 2), _coord(f[5], f[6], 3),
+                  _float(f[7]), _float(f[8]), f[9].decode() or None)
+
+
+def _vtg(talker, f):
+    return VTGFix(talker, _float(f[1]), _float(f[5]), _float(f[7]))
+
+
+def _gsa(talker, f):
+    sats = tuple(int(s) for s in f[3:15] if s)
+    return GSAFix(talker, f[1].decode(), _int(f[2]), sats, _float(f[15]), _float(f[16]), _float(f[17]))
+
+
+# 文の種類 -> (デコード関数, 必要なフィールド数)
+_DECODERS = {
+    b"GGA": (_gga, 10),
+    b"RMC": (_rmc, 10),
+    b"VTG": (_vtg, 8),
+    b"GSA": (_gsa, 18),
+}
+
+HOT_SENTENCES = frozenset(_DECODERS)
+
+
+def decode(sentence):
+    """GGA/RMC/VTG/GSA を namedtuple にする。対象外・フィールド不足・不正値なら None"""
+    fields = _body(sentence).split(b",")
+    head = fields[0]
+    entry = _DECODERS.get(head[-3:])
+    if entry is None:
+        return None
+    func, min_fields = entry
+    if len(fields) < min_fields:
+        return None
+    try:
+        return func(head[:-3].decode(), fields)
+    except ValueError:
+        return None
+
+
+def parse(sentence):
+    """高速デコーダで扱える文はそちらで、それ以外は pynmea2.parse で解析する"""
+    if isinstance(sentence, str):
+        sentence = sentence.encode("ascii", errors="replace")
+    fix = decode(sentence)
+    if fix is not None:
+        return fix
+    return pynmea2.parse(sentence.decode("ascii", errors="replace").strip())
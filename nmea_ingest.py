@@ -0,0 +1,192 @@
+"""シリアルポートなどの入力元からのNMEA取り込み処理
+
+受信済みのバイト列をまとめて読み出し、自前で1文ずつに区切り、
+チェックサムを検証したうえでエポック(同一時刻の文のまとまり)単位で下流へ渡す。
+"""
+import time
+
+# NMEA文の最大長は規格上82文字。余裕を持たせてこれを超えたらゴミとして捨てる
+MAX_SENTENCE_LEN = 128
+# Linuxのシリアル受信バッファ(4095バイト)がこれ以上埋まっていたら取りこぼしの可能性あり
+OS_BUFFER_HIGH_WATER = 4000
+# 時刻フィールドを持つ文 (エポックの区切りに使う)
+TIMED_SENTENCES = (b"GGA", b"RMC", b"GLL", b"ZDA")
+
+
+class SourceClosed(Exception):
+    """入力元が終わった (ファイル末尾 / TCPの切断 / 再生の終了)"""
+
+
+def nmea_checksum_ok(sentence):
+    """'$...*hh' 形式の文のチェックサムを検証する (bytes)"""
+    star = sentence.rfind(b"*")
+    if not sentence.startswith(b"$") or star < 0 or len(sentence) < star + 3:
+        return False
+    calc = 0
+    for b in sentence[1:star]:
+        calc ^= b
+    try:
+        return calc == int(sentence[star + 1:star + 3], 16)
+    except ValueError:
+        return False
+
+
+def sentence_type(sentence):
+    """'$GNGGA,...' -> b'GGA' (トーカーIDを除いた文の種類)"""
+    comma = sentence.find(b",")
+    if comma < 6:
+        return b""
+    return sentence[comma - 3:comma]
+
+
+def sentence_time(sentence):
+    """時刻フィールドを持つ文ならUTC時刻(bytes)を返す。なければNone"""
+    kind = sentence_type(sentence)
+    if kind not in TIMED_SENTENCES:
+        return None
+    fields = sentence.split(b",", 6)
+    if kind == b"GLL":
+        return fields[5] if len(fields) > 5 else None
+    return fields[1] if len(fields) > 1 else None
+
+
+def nmea_seconds(field):
+    """b'123519.50' -> 45319.5 (UTCの0時からの秒)。不正なら None"""
+    try:
+        return int(field[0:2]) * 3600 + int(field[2:4]) * 60 + float(field[4:])
+    except (ValueError, IndexError):
+        return None
+
+
+def epoch_seconds(epoch):
+    """エポックの UTC 時刻 (0時からの秒)。時刻を持つ文がなければ None"""
+    for sentence in epoch:
+        t = sentence_time(sentence)
+        if t:
+            return nmea_seconds(t)
+    return None
+
+
+class SentenceFramer:
+    """バイト列を受け取り、チェックサムの正しいNMEA文(bytes, 改行なし)に区切る"""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self._buf = bytearray()
+
+    def feed(self, data):
+        self.stats["bytes_read"] += len(data)
+        self._buf += data
+        sentences = []
+        start = 0
+        while True:
+            end = self._buf.find(b"\n", start)
+            if end < 0:
+                break
+            line = bytes(self._buf[start:end]).strip()
+            start = end + 1
+            # 文の途中から受信した場合などは '$' 以降だけを使う
+            dollar = line.rfind(b"$")
+            if dollar < 0:
+                continue
+            line = line[dollar:]
+            if nmea_checksum_ok(line):
+                self.stats["sentences"] += 1
+                sentences.append(line)
+            else:
+                self.stats["checksum_errors"] += 1
+        del self._buf[:start]
+        # 改行が来ないまま溜まり続けた場合は破棄する
+        if len(self._buf) > MAX_SENTENCE_LEN:
+            self.stats["overruns"] += 1
+            self._buf.clear()
+        return sentences
+
+
+class EpochAssembler:
+    """同一時刻の文をまとめて1エポックとする
+
+    時刻を持つ文の時刻が変わった時点で、それまでの文を1エポックとして確定する。
+    受信が途切れた場合は flush() で残りを確定する。
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+        self._epoch_time = None
+        self._pending = []
+
+    def add(self, sentences):
+        epochs = []
+        for s in sentences:
+            t = sentence_time(s)
+            if t is not None and t != self._epoch_time:
+                if self._pending and self._epoch_time is not None:
+                    epochs.append(self._pending)
+                    self.stats["epochs"] += 1
+                    self._pending = []
+                self._epoch_time = t
+            self._pending.append(s)
+        return epochs
+
+    def flush(self):
+        if not self._pending:
+            return None
+        epoch, self._pending = self._pending, []
+        self._epoch_time = None
+        self.stats["epochs"] += 1
+        return epoch
+
+
+def new_stats():
+    return {
+        "bytes_read": 0,
+        "sentences": 0,
+        "checksum_errors": 0,
+        "overruns": 0,
+        "epochs": 0,
+        "rx_waiting": 0,
+        "started": time.time(),
+    }
+
+
+def read_available(ser):
+    """受信済みのバイトをまとめて読み出す
+
+    何も溜まっていなければ1バイト目が届くまで ser.timeout だけ待つので、
+    固定のsleepを入れずに済む。
+    """
+    waiting = ser.in_waiting
+    if waiting:
+        return ser.read(waiting), waiting
+    data = ser.read(1)
+    if data:
+        waiting = ser.in_waiting
+        if waiting:
+            data += ser.read(waiting)
+    return data, waiting
+
+
+class NMEAIngest:
+    """入力元1つ分の取り込み処理 (読み出し -> 区切り -> エポック化)"""
+
+    def __init__(self, stats=None):
+        self.stats = stats if stats is not None else new_stats()
+        self.framer = SentenceFramer(self.stats)
+        self.assembler = EpochAssembler(self.stats)
+
+    def poll(self, port):
+        """ポート (sources の SerialPort など) から読めるだけ読み、確定したエポックのリストを返す"""
+        data, waiting = port.read_chunk()
+        self.stats["rx_waiting"] = waiting
+        if waiting >= OS_BUFFER_HIGH_WATER:
+            self.stats["overruns"] += 1
+        if not data:
+            # 受信が途切れたら溜まっている文をエポックとして確定する
+            epoch = self.assembler.flush()
+            return [epoch] if epoch else []
+        return self.assembler.add(self.framer.feed(data))
+
+    def finish(self):
+        """入力元が終わったときに、残っている文をエポックとして確定する"""
+        epoch = self.assembler.flush()
+        return [epoch] if epoch else []
@@ -0,0 +1,94 @@
+"""1PPS (GPIO18) を使ったエポックの時刻付け
+
+GPS受信機は UTC の毎秒ちょうどに 1PPS の立ち上がりを出す。NMEA の文はその後に
+シリアルで届くので、受信した時刻をそのまま使うと転送・処理の遅れの分だけずれる。
+
+立ち上がりごとに「どの UTC 秒の 0 秒か」を対応付けて直近 PPS_HISTORY 個を覚えておき、
+エポックの時刻は NMEA 時刻の整数秒に対応する立ち上がり + 秒未満とする
+(システム時計の UNIX 時刻)。最初の対応付けは、立ち上がりから1秒以内に届いた
+最初の時刻付きエポックの整数秒で行い、以降は立ち上がりの間隔から秒を数えて進める。
+受信が数秒遅れていても整数秒で引くので、その遅れがそのまま時刻の差として見える。
+
+PPS の配線は1台分なので、PPS を使うのは GPIO18 に接続した入力元だけにすること。
+"""
+import time
+from collections import deque
+from threading import Lock
+
+PPS_TIMEOUT = 1.5  # これより古い PPS しかなければ受信時刻で代用する (秒)
+PPS_HISTORY = 60  # 覚えておく立ち上がりの数 (これより遅れたエポックは受信時刻で代用する)
+PPS_MIN_INTERVAL = 0.5  # これより短い間隔の立ち上がりはノイズとして無視する (秒)
+DAY = 24 * 60 * 60
+
+
+def _second_diff(a, b):
+    """0時からの秒 a - b (日付をまたいでも -12時間〜+12時間に収める)"""
+    return (a - b + DAY // 2) % DAY - DAY // 2
+
+
+class PPSClock:
+    def __init__(self, simulated=False):
+        """simulated: 模擬の PPS (sim_gpio)。時刻の計算は同じだが PPS 基準とはしない"""
+        self.simulated = simulated
+        self._lock = Lock()
+        self._edges = deque(maxlen=PPS_HISTORY)  # [立ち上がりの時刻, UTC の秒 (0時からの秒) または None]
+        self.edges = 0
+
+    def on_edge(self, channel=None):
+        """GPIO.add_event_detect のコールバック (立ち上がりごとに呼ばれる)"""
+        now = time.time()
+        with self._lock:
+            label = None
+            if self._edges:
+                prev_time, prev_label = self._edges[-1]
+                interval = now - prev_time
+                if interval < PPS_MIN_INTERVAL:
+                    return
+                if interval > PPS_TIMEOUT:
+                    # PPS が途切れていたら秒の対応付けからやり直す
+                    self._edges.clear()
+                elif prev_label is not None:
+                    label = (prev_label + round(interval)) % DAY
+            self._edges.append([now, label])
+            self.edges += 1
+
+    @property
+    def last_edge(self):
+        with self._lock:
+            return self._edges[-1][0] if self._edges else None
+
+    def _relabel(self, second):
+        """最新の立ち上がりを UTC の second 秒とし、それ以前も間隔から数え直す"""
+        later_time = None
+        for edge in reversed(self._edges):
+            if later_time is not None:
+                second = (second - round(later_time - edge[0])) % DAY
+            edge[1] = second
+            later_time = edge[0]
+
+    def epoch_time(self, nmea_seconds, now=None):
+        """NMEA時刻 (0時からの秒) のエポックの時刻を返す: (UNIX時刻, PPS基準か)"""
+        if now is None:
+            now = time.time()
+        if nmea_seconds is None:
+            return now, False
+        second = int(nmea_seconds) % DAY
+        frac = nmea_seconds - int(nmea_seconds)
+        with self._lock:
+            if not self._edges or now - self._edges[-1][0] > PPS_TIMEOUT:
+                return now, False
+            latest_time, latest_label = self._edges[-1]
+            if latest_label is None or _second_diff(second, latest_label) > 0:
+                # 対応付け前か、対応付けより新しい秒のエポックが届いた: 直近の立ち上がりをこの秒とする
+                # (その秒の立ち上がりを取りこぼしている場合は対応付けない)
+                if now - latest_time >= 1.0:
+                    return now, False
+                self._relabel(second)
+            for edge_time, label in reversed(self._edges):
+                if label == second:
+                    t = edge_time + frac
+                    if t > now:
+                        return now, False
+                    return t, not self.simulated
+        # PPS_HISTORY 秒より前のエポック
+        return now, False
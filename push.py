@@ -0,0 +1,170 @@
+"""新しい fix をブラウザへプッシュするための配信部
+
+fix ごとに /status の応答 (JSON文字列) を1回だけ組み立て、版数 (version) を振って保持する。
+SSE や long-poll の購読者はこの版数が進むのを待ち、同じ文字列をそのまま送る。
+
+複数の機体を扱う場合は FleetBroadcaster から機体ごとの StatusBroadcaster を作る。
+Condition は機体ごとに持ち、ある機体の更新で起きるのはその機体の購読者だけ。
+全機体分の購読者は FleetBroadcaster の Condition と通し番号 (fleet_version) で待ち、
+1本の接続で「前回以降に更新された機体」の状態だけを受け取れる。
+JSON の組み立てはロックの外で行うので、機体のスレッド同士が互いを待つことはない。
+
+版数・イベントID は ETag や SSE の id としてクライアントに残るので、0 からではなく
+起動時刻 (マイクロ秒) から数え始める。再起動前の値が再起動後の値と一致したり、
+それを上回ったりしないようにするため (JavaScript の数値でも正確に扱える範囲に収まる)。
+"""
+import json
+import time
+from collections import deque
+from threading import Condition
+
+
+def initial_version():
+    """版数・イベントIDの初期値: 起動時刻 (マイクロ秒)"""
+    return time.time_ns() // 1000
+
+
+class StatusBroadcaster:
+    def __init__(self, fleet=None):
+        self._fleet = fleet
+        self._cond = Condition()
+        self._next_version = initial_version()  # 版数の払い出し用
+        self._version = self._next_version  # 公開済みの版数
+        self.fleet_version = 0  # 最後に公開したときの全機体通し番号
+        self._body = json.dumps({"version": self._version})
+
+    def publish(self, data):
+        """最新状態を差し替えてこの機体の購読者 (と全機体分の購読者) を起こす。新しい版数を返す"""
+        with self._cond:
+            self._next_version += 1
+            version = self._next_version
+        body = json.dumps(dict(data, version=version, published=time.time()))
+        with self._cond:
+            # 同時に publish された場合、後から払い出した版より古いものは捨てる
+            if version < self._version:
+                return self._version
+            self._version = version
+            self._body = body
+            self._cond.notify_all()
+        if self._fleet is not None:
+            self._fleet._notify(self)
+        return version
+
+    def latest(self):
+        """(version, JSON文字列)"""
+        with self._cond:
+            return self._version, self._body
+
+    def wait(self, after_version, timeout):
+        """版数が after_version より新しくなるまで最大 timeout 秒待つ
+
+        戻り値は latest() と同じ。タイムアウトした場合は版数が進んでいない。
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._version > after_version, timeout)
+            return self._version, self._body
+
+    def stream(self, after_version=0, heartbeat=15.0, should_run=lambda: True):
+        """SSE (text/event-stream) 形式で更新を送り続けるジェネレータ
+
+        更新がない間も heartbeat 秒ごとにコメント行を送り、切断を検知できるようにする。
+        途中の版を取りこぼしても最新の状態だけを送る。
+        """
+        version = after_version
+        yield "retry: 2000\n\n"
+        while should_run():
+            new_version, body = self.wait(version, heartbeat)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            yield f"id: {version}\ndata: {body}\n\n"
+
+
+class FleetBroadcaster:
+    """機体ごとの StatusBroadcaster をまとめ、全機体分の更新を1本で配信する"""
+
+    def __init__(self):
+        self._cond = Condition()
+        self._version = initial_version()
+        self._devices = {}
+
+    def device(self, device_id):
+        """機体の StatusBroadcaster (なければ作る)"""
+        with self._cond:
+            if device_id not in self._devices:
+                self._devices[device_id] = StatusBroadcaster(fleet=self)
+            return self._devices[device_id]
+
+    def _notify(self, broadcaster):
+        with self._cond:
+            self._version += 1
+            broadcaster.fleet_version = self._version
+            self._cond.notify_all()
+
+    def _changed(self, after_version):
+        return [b._body for b in self._devices.values() if b.fleet_version > after_version]
+
+    def wait(self, after_version, timeout):
+        """いずれかの機体が更新されるまで最大 timeout 秒待つ
+
+        戻り値: (通し番号, 前回以降に更新された機体の JSON文字列のリスト)
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._version > after_version, timeout)
+            return self._version, self._changed(after_version)
+
+    def stream(self, after_version=0, heartbeat=15.0, should_run=lambda: True):
+        """全機体分の SSE。更新された機体ごとに1イベント (data に機体の状態) を送る"""
+        version = after_version
+        yield "retry: 2000\n\n"
+        while should_run():
+            new_version, bodies = self.wait(version, heartbeat)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            yield "".join(f"id: {version}\ndata: {body}\n\n" for body in bodies)
+
+
+class EventBroadcaster:
+    """出来事 (ジオフェンスの出入りなど) を取りこぼさずに配信する
+
+    StatusBroadcaster と違い最新状態だけでなく個々のイベントを送るので、
+    直近 history 件を通し番号付きで保持し、再接続時は Last-Event-ID 以降を送り直す。
+    """
+
+    def __init__(self, history=1000):
+        self._cond = Condition()
+        self._events = deque(maxlen=history)  # (id, JSON文字列)
+        self._last_id = initial_version()
+
+    def publish(self, event):
+        with self._cond:
+            self._last_id += 1
+            self._events.append((self._last_id, json.dumps(dict(event, id=self._last_id))))
+            self._cond.notify_all()
+            return self._last_id
+
+    def since(self, after_id):
+        """(最新のID, after_id より後のイベントの [(id, JSON文字列), ...])"""
+        with self._cond:
+            return self._last_id, [e for e in self._events if e[0] > after_id]
+
+    def wait(self, after_id, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self._last_id > after_id, timeout)
+            return self._last_id, [e for e in self._events if e[0] > after_id]
+
+    def stream(self, after_id=0, heartbeat=15.0, should_run=lambda: True):
+        """SSE 形式のジェネレータ。after_id が 0 なら接続以降のイベントだけを送る"""
+        if not after_id:
+            after_id = self.since(0)[0]
+        yield "retry: 2000\n\n"
+        while should_run():
+            last_id, events = self.wait(after_id, heartbeat)
+            if last_id == after_id:
+                yield ": keep-alive\n\n"
+                continue
+            after_id = last_id
+            yield "".join(f"id: {event_id}\ndata: {body}\n\n" for event_id, body in events)
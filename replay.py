@@ -0,0 +1,136 @@
+"""記録したNMEAの再生と、合成した走行データの生成 (実機なしでの動作確認・ベンチマーク用)
+
+どちらも sources のポートと同じ read_chunk() を持ち、実機と同じ取り込み処理を通る。
+エポック (同一時刻の文のまとまり) ごとに、NMEAの時刻差どおりの間隔で送り出す。
+speed=10 なら10倍速、speed=0 なら待たずに送れるだけ送る。
+"""
+import math
+import time
+from functools import reduce
+
+from nmea_ingest import SourceClosed, epoch_seconds, sentence_time
+
+KNOTS_PER_MPS = 1 / 0.514444
+
+
+def with_checksum(body):
+    """'GNGGA,...' -> '$GNGGA,...*hh\\r\\n' (bytes)"""
+    calc = reduce(lambda a, b: a ^ b, body.encode("ascii"), 0)
+    return f"${body}*{calc:02X}\r\n".encode("ascii")
+
+
+def _ddmm(value, deg_len):
+    value = abs(value)
+    deg = int(value)
+    return f"{deg:0{deg_len}d}{(value - deg) * 60:07.4f}"
+
+
+def epoch_sentences(i, lat, lon, speed_knots=12.0, course=84.4, hz=10, talker="GN"):
+    """i 番目のエポック (時刻 i/hz 秒) の文 (bytes のリスト) を作る"""
+    sec = i / hz
+    hh, rem = divmod(int(sec), 3600)
+    mm, ss = divmod(rem, 60)
+    t = f"{hh % 24:02d}{mm:02d}{ss:02d}.{int(round((sec % 1) * 100)) % 100:02d}"
+    ns = "N" if lat >= 0 else "S"
+    ew = "E" if lon >= 0 else "W"
+    la, lo = _ddmm(lat, 2), _ddmm(lon, 3)
+    return [
+        with_checksum(f"{talker}GGA,{t},{la},{ns},{lo},{ew},1,10,0.9,45.4,M,39.9,M,,"),
+        with_checksum(f"{talker}RMC,{t},A,{la},{ns},{lo},{ew},{speed_knots:.1f},{course:.1f},180226,,,A"),
+        with_checksum(f"{talker}VTG,{course:.1f},T,,M,{speed_knots:.1f},N,{speed_knots * 1.852:.1f},K,A"),
+        with_checksum(f"{talker}GSA,A,3,04,05,09,12,24,25,29,31,,,,,1.8,0.9,1.5"),
+        with_checksum("GPGSV,3,1,10,04,55,210,42,05,12,040,35,09,40,300,44,12,22,180,38"),
+        with_checksum("GLGSV,2,1,06,65,33,050,40,66,70,120,45,72,15,250,32,,,,"),
+    ]
+
+
+def synthetic_epochs(lat=35.681236, lon=139.767125, hz=10, radius=200.0, speed=8.0, start=0, count=None):
+    """半径 radius (m) の円を速度 speed (m/s) で回り続ける車両のエポックを生成する"""
+    omega = speed / radius / hz  # 1エポックあたりの回転角
+    i = start
+    while count is None or i < start + count:
+        a = i * omega
+        north = radius * math.sin(a)
+        east = radius * (1 - math.cos(a))
+        course = math.degrees(a) % 360
+        yield epoch_sentences(i, lat + north / 111320.0,
+                              lon + east / (111320.0 * math.cos(math.radians(lat))),
+                              speed * KNOTS_PER_MPS, course, hz)
+        i += 1
+
+
+def file_epochs(path):
+    """NMEAの記録ファイルをエポックごとに区切って返す"""
+    epoch, epoch_time = [], None
+    with open(path, "rb") as f:
+        for line in f:
+            start = line.find(b"$")
+            if start < 0:
+                continue
+            line = line[start:].rstrip() + b"\r\n"
+            t = sentence_time(line)
+            if t is not None and t != epoch_time:
+                if epoch and epoch_time is not None:
+                    yield epoch
+                    epoch = []
+                epoch_time = t
+            epoch.append(line)
+    if epoch:
+        yield epoch
+
+
+class ReplayPort:
+    """エポックのイテレータを、NMEAの時刻どおりの間隔 (の 1/speed) で送り出すポート
+
+    emitted には送り出したエポックの NMEA時刻 (0時からの秒, 小数2桁) -> 送り出した時刻
+    (time.perf_counter) を残す。ベンチマークで fix からクライアントまでの遅延を測るのに使う。
+    """
+
+    def __init__(self, epochs, speed=1.0, timeout=0.2, record_emitted=False):
+        self._epochs = iter(epochs)
+        self.speed = speed
+        self.timeout = timeout
+        self.emitted = {} if record_emitted else None
+        self._base = None  # (最初のエポックのNMEA時刻, 送り出した時刻)
+        self._next = None
+        self._last_t = None
+        self._day = 0.0  # 0時をまたいだ分の補正
+        self._idle = False  # 直前に空読みを返したか
+
+    def _due(self, t):
+        if t is None or self.speed <= 0:
+            return 0.0
+        if self._last_t is not None and t + self._day < self._last_t - 43200:
+            self._day += 86400
+        t += self._day
+        self._last_t = t
+        if self._base is None:
+            self._base = (t, time.perf_counter())
+        return self._base[1] + (t - self._base[0]) / self.speed
+
+    def read_chunk(self):
+        if self._next is None:
+            epoch = next(self._epochs, None)
+            if epoch is None:
+                raise SourceClosed("再生が終わりました")
+            t = epoch_seconds(epoch)
+            self._next = (epoch, t, self._due(t))
+        epoch, t, due = self._next
+        wait = due - time.perf_counter()
+        if wait > 0 and not self._idle:
+            # 次のエポックまで回線が空く: 実機と同様に空読みを返し、受信側にエポックを確定させる
+            self._idle = True
+            return b"", 0
+        if wait > self.timeout:
+            time.sleep(self.timeout)
+            return b"", 0
+        if wait > 0:
+            time.sleep(wait)
+        self._next = None
+        self._idle = False
+        if self.emitted is not None and t is not None:
+            self.emitted[round(t % 86400, 2)] = time.perf_counter()
+        return b"".join(epoch), 0
+
+    def close(self):
+        pass
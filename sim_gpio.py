@@ -0,0 +1,168 @@
+"""RPi.GPIO の代わり (Raspberry Pi 以外での動作確認・ベンチマーク用)
+
+main.py で使う範囲の API を同じ名前で持つ。入力ピンは内部の値を返すだけだが、
+PPS_PIN (GPIO18) には毎秒ちょうど (time.time() の整数秒) に立ち上がり、
+PPS_PULSE 秒後に立ち下がる 1PPS 信号を模擬する。add_event_detect で登録した
+コールバックは実機と同じく別スレッドから channel を引数に呼ばれる。
+"""
+import threading
+import time
+
+BCM = 11
+BOARD = 10
+IN = 1
+OUT = 0
+HIGH = 1
+LOW = 0
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+RISING = 31
+FALLING = 32
+BOTH = 33
+
+PPS_PIN = 18
+PPS_PULSE = 0.1  # パルス幅 (秒)
+
+_lock = threading.Lock()
+_mode = None
+_levels = {}
+_detect = {}  # channel -> {"edge", "callbacks", "bouncetime", "detected", "last"}
+_edge = threading.Condition(_lock)
+_pps_thread = None
+_pps_stop = threading.Event()
+
+
+def setmode(mode):
+    global _mode
+    _mode = mode
+
+
+def getmode():
+    return _mode
+
+
+def setwarnings(flag):
+    pass
+
+
+def setup(channel, direction, pull_up_down=PUD_OFF, initial=None):
+    with _lock:
+        if direction == OUT:
+            _levels[channel] = LOW if initial is None else initial
+        elif channel == PPS_PIN:
+            # 1PPS はGPS側が駆動するので、プルアップ指定でもパルス以外は LOW
+            _levels[channel] = LOW
+        else:
+            _levels[channel] = HIGH if pull_up_down == PUD_UP else LOW
+    if channel == PPS_PIN and direction == IN:
+        _start_pps()
+
+
+def input(channel):
+    with _lock:
+        return _levels.get(channel, LOW)
+
+
+def output(channel, value):
+    set_level(channel, HIGH if value else LOW)
+
+
+def set_level(channel, level):
+    """ピンの値を変える (模擬信号用)。登録済みのエッジ検出があればコールバックを呼ぶ"""
+    with _lock:
+        old = _levels.get(channel, LOW)
+        _levels[channel] = level
+        entry = _detect.get(channel)
+        if old == level or entry is None:
+            return
+        edge = RISING if level == HIGH else FALLING
+        if entry["edge"] not in (edge, BOTH):
+            return
+        now = time.monotonic()
+        if entry["bouncetime"] and (now - entry["last"]) * 1000 < entry["bouncetime"]:
+            return
+        entry["last"] = now
+        entry["detected"] = True
+        callbacks = list(entry["callbacks"])
+        _edge.notify_all()
+    for callback in callbacks:
+        callback(channel)
+
+
+def add_event_detect(channel, edge, callback=None, bouncetime=None):
+    with _lock:
+        if channel in _detect:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        _detect[channel] = {"edge": edge, "callbacks": [callback] if callback else [],
+                            "bouncetime": bouncetime, "detected": False, "last": 0.0}
+
+
+def add_event_callback(channel, callback):
+    with _lock:
+        if channel not in _detect:
+            raise RuntimeError("Add event detection using add_event_detect first before adding a callback")
+        _detect[channel]["callbacks"].append(callback)
+
+
+def remove_event_detect(channel):
+    with _lock:
+        _detect.pop(channel, None)
+
+
+def event_detected(channel):
+    with _lock:
+        entry = _detect.get(channel)
+        if entry is None or not entry["detected"]:
+            return False
+        entry["detected"] = False
+        return True
+
+
+def wait_for_edge(channel, edge, bouncetime=None, timeout=None):
+    """edge を待つ。timeout はミリ秒 (RPi.GPIO と同じ)。タイムアウトしたら None"""
+    registered = channel in _detect
+    if not registered:
+        add_event_detect(channel, edge, bouncetime=bouncetime)
+    try:
+        with _lock:
+            _detect[channel]["detected"] = False
+            ok = _edge.wait_for(lambda: _detect[channel]["detected"],
+                                None if timeout is None else timeout / 1000)
+            _detect[channel]["detected"] = False
+        return channel if ok else None
+    finally:
+        if not registered:
+            remove_event_detect(channel)
+
+
+def cleanup(channel=None):
+    with _lock:
+        if channel is None:
+            _levels.clear()
+            _detect.clear()
+        else:
+            _levels.pop(channel, None)
+            _detect.pop(channel, None)
+    if channel in (None, PPS_PIN):
+        _pps_stop.set()
+
+
+def _start_pps():
+    global _pps_thread
+    if _pps_thread is not None and _pps_thread.is_alive():
+        return
+    _pps_stop.clear()
+    _pps_thread = threading.Thread(target=_pps_loop, name="sim-pps", daemon=True)
+    _pps_thread.start()
+
+
+def _pps_loop():
+    while not _pps_stop.is_set():
+        # 次の整数秒まで待って立ち上げる
+        if _pps_stop.wait(1.0 - time.time() % 1.0):
+            break
+        set_level(PPS_PIN, HIGH)
+        if _pps_stop.wait(PPS_PULSE):
+            break
+        set_level(PPS_PIN, LOW)
@@ -0,0 +1,190 @@
+"""地図のズームレベルに合わせた軌跡の間引き (Level of Detail)
+
+1ピクセル未満の変化は地図上で見えないので、ズームごとの1ピクセルの大きさを許容誤差として
+Douglas-Peucker 法で点を間引く。距離計算は NumPy でまとめて行う。
+前処理として、許容誤差の格子で同じマスに続けて入る点を落としてから DP にかける。
+
+結果は (開始時刻, 終了時刻, ズーム) ごとにキャッシュする。終了時刻を指定しない (ライブ) 場合、
+新しい fix が来たら最後から2番目の採用点以降だけを計算し直して延長する。
+"""
+import math
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+EARTH_RADIUS = 6378137.0
+# Web メルカトルのズーム0での1ピクセルあたりのメートル (赤道上)
+METERS_PER_PIXEL_Z0 = 2 * math.pi * EARTH_RADIUS / 256
+
+
+def zoom_tolerance(zoom, lat, pixels=1.0):
+    """ズーム zoom・緯度 lat での pixels ピクセル分の長さ (メートル)"""
+    return METERS_PER_PIXEL_Z0 * math.cos(math.radians(lat)) / (2 ** zoom) * pixels
+
+
+def project(lat, lon, lat0):
+    """緯度経度 -> lat0 を基準にした平面座標 (メートル)。狭い範囲なら十分な近似"""
+    k = math.radians(1) * EARTH_RADIUS
+    return np.asarray(lon) * (k * math.cos(math.radians(lat0))), np.asarray(lat) * k
+
+
+def grid_reduce(x, y, tolerance):
+    """許容誤差の格子で同じマスに続けて入る点を落とす。残す点の添字を返す (両端は必ず残す)"""
+    n = len(x)
+    if n < 3:
+        return np.arange(n)
+    cx = np.floor(x / tolerance)
+    cy = np.floor(y / tolerance)
+    changed = np.empty(n, dtype=bool)
+    changed[0] = True
+    np.not_equal(cx[1:], cx[:-1], out=changed[1:])
+    changed[1:] |= cy[1:] != cy[:-1]
+    changed[-1] = True
+    return np.flatnonzero(changed)
+
+
+def douglas_peucker(x, y, tolerance):
+    """Douglas-Peucker 法で残す点の添字を返す (再帰の代わりにスタックを使う)"""
+    n = len(x)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    tol2 = tolerance * tolerance
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        xs = x[a + 1:b] - x[a]
+        ys = y[a + 1:b] - y[a]
+        dx = x[b] - x[a]
+        dy = y[b] - y[a]
+        seg2 = dx * dx + dy * dy
+        if seg2 == 0:
+            d2 = xs * xs + ys * ys
+        else:
+            cross = xs * dy - ys * dx
+            d2 = cross * cross / seg2
+        i = int(d2.argmax())
+        if d2[i] > tol2:
+            m = a + 1 + i
+            keep[m] = True
+            stack.append((m, b))
+            stack.append((a, m))
+    return np.flatnonzero(keep)
+
+
+def simplify(lat, lon, tolerance, lat0=None):
+    """緯度経度の列を間引き、残す点の添字を返す (tolerance はメートル)"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if len(lat) < 3:
+        return np.arange(len(lat))
+    if lat0 is None:
+        lat0 = float(lat[0])
+    x, y = project(lat, lon, lat0)
+    reduced = grid_reduce(x, y, tolerance)
+    return reduced[douglas_peucker(x[reduced], y[reduced], tolerance)]
+
+
+def in_bounds(lat, lon, south, west, north, east):
+    """表示範囲内の点と、その前後の点 (範囲の端をまたぐ線のため) のマスク"""
+    mask = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+    grown = mask.copy()
+    grown[1:] |= mask[:-1]
+    grown[:-1] |= mask[1:]
+    return grown
+
+
+class SimplifiedTrackCache:
+    """TrackBuffer の間引き結果を (開始時刻, 終了時刻, ズーム) ごとに保持する"""
+
+    def __init__(self, track, max_entries=32, pixels=1.0):
+        self.track = track
+        self.max_entries = max_entries
+        self.pixels = pixels
+        self._entries = OrderedDict()  # key -> {"seqs", "lat", "lon", "end_seq"}
+        self._lock = Lock()
+
+    def get(self, zoom, start=None, end=None):
+        """間引いた軌跡を返す: (seq の配列, lat の配列, lon の配列, 計算済みの末尾 seq)
+
+        start / end は時刻 (秒)。None なら保持している最古 / 最新まで。
+        """
+        key = (start, end, zoom)
+        first_seq = self.track.oldest_seq if start is None else self.track.seq_at(start)
+        last_seq = self.track.next_seq if end is None else self.track.seq_at(end)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                # 先頭がリングバッファから消えていたら、消えた採用点だけを落とす
+                if len(entry["seqs"]) and entry["seqs"][0] < first_seq:
+                    entry = self._trim(entry, first_seq)
+            if entry is None:
+                entry = self._compute(zoom, first_seq, last_seq)
+            elif entry["end_seq"] < last_seq:
+                entry = self._extend(entry, zoom, last_seq)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry["seqs"], entry["lat"], entry["lon"], entry["end_seq"]
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _load(self, first_seq, last_seq):
+        start, end, cols = self.track.window(first_seq, last_seq)
+        lat = np.frombuffer(cols["lat"], dtype=np.float64) if len(cols["lat"]) else np.empty(0)
+        lon = np.frombuffer(cols["lon"], dtype=np.float64) if len(cols["lon"]) else np.empty(0)
+        return start, end, lat, lon
+
+    def _compute(self, zoom, first_seq, last_seq):
+        start, end, lat, lon = self._load(first_seq, last_seq)
+        if len(lat) == 0:
+            return {"seqs": np.empty(0, dtype=np.int64), "lat": lat, "lon": lon, "end_seq": end, "lat0": None}
+        lat0 = float(lat[0])
+        idx = simplify(lat, lon, zoom_tolerance(zoom, lat0, self.pixels), lat0)
+        return {"seqs": idx + start, "lat": lat[idx], "lon": lon[idx], "end_seq": end, "lat0": lat0}
+
+    def _trim(self, entry, first_seq):
+        """first_seq より前の採用点を落とし、first_seq の点を新しい先頭 (起点) として残す
+
+        リングバッファが一巡したあとは fix ごとに最古の seq が進むので、
+        作り直さずに先頭だけを削る。採用点が残らない場合は None (作り直す)。
+        """
+        seqs = entry["seqs"]
+        keep = int(np.searchsorted(seqs, first_seq))
+        if keep >= len(seqs):
+            return None
+        start, end, cols = self.track.window(first_seq, first_seq + 1)
+        if end <= start:
+            return None
+        lat, lon = entry["lat"][keep:], entry["lon"][keep:]
+        seqs = seqs[keep:]
+        if seqs[0] != start:
+            seqs = np.concatenate(([start], seqs))
+            lat = np.concatenate(([cols["lat"][0]], lat))
+            lon = np.concatenate(([cols["lon"][0]], lon))
+        return dict(entry, seqs=seqs, lat=lat, lon=lon)
+
+    def _extend(self, entry, zoom, last_seq):
+        """最後から2番目の採用点を起点に、それ以降だけを間引き直して付け足す"""
+        seqs = entry["seqs"]
+        if len(seqs) < 2 or entry["lat0"] is None:
+            first = int(seqs[0]) if len(seqs) else entry["end_seq"]
+            return self._compute(zoom, first, last_seq)
+        anchor = int(seqs[-2])
+        start, end, lat, lon = self._load(anchor, last_seq)
+        lat0 = entry["lat0"]
+        idx = simplify(lat, lon, zoom_tolerance(zoom, lat0, self.pixels), lat0)
+        return {
+            "seqs": np.concatenate((seqs[:-2], idx + start)),
+            "lat": np.concatenate((entry["lat"][:-2], lat[idx])),
+            "lon": np.concatenate((entry["lon"][:-2], lon[idx])),
+            "end_seq": end,
+            "lat0": lat0,
+        }
@@ -0,0 +1,144 @@
+"""NMEAの入力元 (シリアルポート / TCP / ファイル)
+
+入力元は '<機体ID>=<種類>:<場所>' の文字列で指定する。
+    rc1=serial:/dev/ttyAMA0@9600
+    rc2=tcp:192.168.0.10:10110
+    rc3=file:logs/rc3.nmea
+    rc4=replay:logs/rc4.nmea@10   (記録を10倍速で再生。@0 なら待たずに流す。省略時は等速)
+    rc5=sim:10@1                  (10Hzの合成データを等速で生成)
+open() で開いたポートは read_chunk() で受信済みのバイトをまとめて返す
+(何も届いていなければ最大 timeout 秒待って b"" を返す)。
+"""
+import socket
+
+import serial
+
+from nmea_ingest import SourceClosed, read_available
+import replay
+
+DEFAULT_BAUDRATE = 9600
+DEFAULT_TIMEOUT = 0.2  # 受信待ちの最大時間 (秒)
+FILE_CHUNK = 4096
+KINDS = ("serial", "tcp", "file", "replay", "sim")
+
+
+class SerialPort:
+    def __init__(self, path, baudrate, timeout):
+        self.ser = serial.Serial(
+            port=path,
+            baudrate=baudrate,
+            timeout=timeout,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            bytesize=serial.EIGHTBITS
+        )
+
+    def read_chunk(self):
+        return read_available(self.ser)
+
+    def close(self):
+        self.ser.close()
+
+
+class TCPPort:
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=5)
+        self.sock.settimeout(timeout)
+
+    def read_chunk(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.timeout:
+            return b"", 0
+        if not data:
+            raise SourceClosed("TCP接続が切断されました")
+        return data, 0
+
+    def close(self):
+        self.sock.close()
+
+
+class FilePort:
+    def __init__(self, path):
+        self.f = open(path, "rb")
+
+    def read_chunk(self):
+        data = self.f.read(FILE_CHUNK)
+        if not data:
+            raise SourceClosed("ファイルの末尾に達しました")
+        return data, 0
+
+    def close(self):
+        self.f.close()
+
+
+class Source:
+    def __init__(self, device_id, kind, location, baudrate=DEFAULT_BAUDRATE, timeout=DEFAULT_TIMEOUT, speed=1.0,
+                 pps=False):
+        self.device_id = device_id
+        self.kind = kind
+        self.location = location
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.speed = speed  # replay / sim の再生速度
+        self.pps = pps  # GPIO18 の 1PPS がこの受信機のものか
+
+    def __repr__(self):
+        return f"{self.device_id}={self.kind}:{self.location}" + ("+pps" if self.pps else "")
+
+    @property
+    def reconnect(self):
+        """途切れたら開き直すか (ファイル・再生は最後まで読んだら終わり)"""
+        return self.kind not in ("file", "replay")
+
+    def open(self):
+        if self.kind == "serial":
+            return SerialPort(self.location, self.baudrate, self.timeout)
+        if self.kind == "tcp":
+            host, _, port = self.location.rpartition(":")
+            return TCPPort(host, int(port), self.timeout)
+        if self.kind == "file":
+            return FilePort(self.location)
+        if self.kind == "replay":
+            return replay.ReplayPort(replay.file_epochs(self.location), self.speed, self.timeout)
+        if self.kind == "sim":
+            return replay.ReplayPort(replay.synthetic_epochs(hz=float(self.location)), self.speed, self.timeout)
+        raise ValueError(f"未対応の入力元です: {self.kind}")
+
+
+def parse_source(spec):
+    """'rc1=serial:/dev/ttyAMA0@115200' -> Source (@ 以降は serial ならボーレート、replay / sim なら再生速度)
+
+    末尾に +pps を付けた入力元は、GPIO18 の 1PPS でエポックの時刻を補正する。
+    """
+    spec = spec.strip()
+    pps = spec.endswith("+pps")
+    if pps:
+        spec = spec[:-len("+pps")]
+    device_id, sep, rest = spec.partition("=")
+    kind, sep2, location = rest.partition(":")
+    if not sep or not sep2 or not device_id or not location:
+        raise ValueError(f"入力元の指定が不正です: {spec!r} (例: rc1=serial:/dev/ttyAMA0@9600)")
+    if kind not in KINDS:
+        raise ValueError(f"未対応の入力元です: {kind} ({' / '.join(KINDS)})")
+    baudrate = DEFAULT_BAUDRATE
+    speed = 1.0
+    if kind in ("serial", "replay", "sim") and "@" in location:
+        location, _, option = location.rpartition("@")
+        if kind == "serial":
+            baudrate = int(option)
+        else:
+            speed = float(option.rstrip("x"))
+    return Source(device_id, kind, location, baudrate, speed=speed, pps=pps)
+
+
+def parse_sources(text):
+    """カンマ区切りの指定をまとめて解析する (機体IDの重複は不可)"""
+    sources = [parse_source(spec) for spec in text.split(",") if spec.strip()]
+    ids = [s.device_id for s in sources]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"機体IDが重複しています: {ids}")
+    pps = [s.device_id for s in sources if s.pps]
+    if len(pps) > 1:
+        raise ValueError(f"+pps を付けられるのは GPIO18 に接続した1台だけです: {pps}")
+    return sources
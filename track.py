@@ -0,0 +1,96 @@
+"""軌跡 (fix の履歴) を保持する固定長リングバッファ
+
+dict のリストではなく列ごとの array に格納するので、10Hzで1日走らせても
+確保済みの領域を使い回すだけでメモリ使用量は増えない。
+各 fix には通し番号 (seq) を振り、クライアントは前回受け取った seq 以降の差分だけを取得する。
+"""
+from array import array
+from threading import Lock
+
+# 列名と array の型 (時刻・座標は倍精度、それ以外は単精度で十分)
+COLUMNS = (("t", "d"), ("lat", "d"), ("lon", "d"), ("alt", "f"), ("speed", "f"), ("hdop", "f"))
+NAN = float("nan")
+
+
+class TrackBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._cols = {name: array(code, bytes(array(code).itemsize * capacity)) for name, code in COLUMNS}
+        self._next_seq = 0  # 次に書き込む fix の seq
+        self._lock = Lock()
+
+    @property
+    def next_seq(self):
+        return self._next_seq
+
+    @property
+    def oldest_seq(self):
+        return max(0, self._next_seq - self.capacity)
+
+    def __len__(self):
+        return self._next_seq - self.oldest_seq
+
+    def append(self, t, lat, lon, alt=None, speed=None, hdop=None):
+        """fix を1件追加し、その seq を返す (欠損値は NaN で保持)"""
+        values = (t, lat, lon, alt, speed, hdop)
+        with self._lock:
+            seq = self._next_seq
+            i = seq % self.capacity
+            for (name, _), value in zip(COLUMNS, values):
+                self._cols[name][i] = NAN if value is None else value
+            self._next_seq = seq + 1
+        return seq
+
+    def since(self, seq, limit=None):
+        """seq 以降の fix を列ごとのリストで返す
+
+        戻り値: (from_seq, next_seq, columns)
+        seq が既に上書きされていれば from_seq は保持している最古の seq になる。
+        limit を超える分は next_seq から再度取得してもらう。
+        """
+        with self._lock:
+            start = min(max(seq, self.oldest_seq), self._next_seq)
+            end = self._next_seq if limit is None else min(self._next_seq, start + limit)
+            columns = {name: self._slice(col, start, end) for name, col in self._cols.items()}
+        return start, end, columns
+
+    def seq_at(self, t):
+        """時刻 t 以降で最初の fix の seq (fix は時刻順に追加される前提で二分探索する)"""
+        with self._lock:
+            lo, hi = self.oldest_seq, self._next_seq
+            col = self._cols["t"]
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if col[mid % self.capacity] < t:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+
+    def window(self, start, end, names=("lat", "lon")):
+        """seq が [start, end) の fix の指定列を array のコピーで返す (範囲は保持分に切り詰める)
+
+        戻り値: (start, end, {列名: array})
+        """
+        with self._lock:
+            start = min(max(start, self.oldest_seq), self._next_seq)
+            end = min(max(end, start), self._next_seq)
+            i, j = start % self.capacity, end % self.capacity
+            columns = {}
+            for name in names:
+                col = self._cols[name]
+                if start == end:
+                    columns[name] = col[:0]
+                elif i < j:
+                    columns[name] = col[i:j]
+                else:
+                    columns[name] = col[i:] + col[:j]
+        return start, end, columns
+
+    def _slice(self, col, start, end):
+        i, j = start % self.capacity, end % self.capacity
+        if start == end:
+            return []
+        if i < j:
+            return col[i:j].tolist()
+        return col[i:].tolist() + col[:j].tolist()
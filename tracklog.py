@@ -0,0 +1,168 @@
+"""fix をディスクに残す追記専用のバイナリログ
+
+1件 = 固定長36バイト (t, lat, lon: double / alt, speed, hdop: float, リトルエンディアン)。
+SEGMENT_RECORDS 件ごとに新しいセグメントファイル (track-<開始時刻>.bin) に切り替え、
+INDEX_STRIDE 件ごとに (時刻, 件番号) を疎なインデックス (.idx) に書く。
+時刻範囲の検索は該当セグメントだけを mmap し、インデックスと二分探索で開始位置へ飛ぶ。
+
+書き込みは append() でメモリに溜め、flush() でまとめて書いて fsync する
+(SDカードに1文ごとの fsync をさせないため)。
+"""
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_left, bisect_right
+from threading import Lock
+
+RECORD = struct.Struct("<dddfff")
+RECORD_SIZE = RECORD.size
+INDEX_ENTRY = struct.Struct("<dQ")
+SEGMENT_RECORDS = 10 * 60 * 60  # 10Hzで1時間分 (約1.3MB)
+INDEX_STRIDE = 100
+NAN = float("nan")
+
+
+def _segment_name(t):
+    return f"track-{int(t * 1000):015d}.bin"
+
+
+def _segment_start(name):
+    return int(name[6:-4]) / 1000.0
+
+
+class TrackLogWriter:
+    def __init__(self, directory, segment_records=SEGMENT_RECORDS, index_stride=INDEX_STRIDE):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.index_stride = index_stride
+        os.makedirs(directory, exist_ok=True)
+        self._pending = []  # まだ書いていない (t, bytes)
+        self._lock = Lock()  # _pending 用
+        self._io_lock = Lock()  # ファイル操作用 (flush 同士の排他)
+        self._data = None
+        self._index = None
+        self._count = 0  # 現在のセグメントの件数
+
+    def append(self, t, lat, lon, alt=None, speed=None, hdop=None):
+        record = RECORD.pack(t, lat, lon,
+                             NAN if alt is None else alt,
+                             NAN if speed is None else speed,
+                             NAN if hdop is None else hdop)
+        with self._lock:
+            self._pending.append((t, record))
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """溜まっている fix をまとめて書き込み、fsync する。書いた件数を返す"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        with self._io_lock:
+            i = 0
+            while i < len(pending):
+                if self._data is None or self._count >= self.segment_records:
+                    self._rotate(pending[i][0])
+                n = min(len(pending) - i, self.segment_records - self._count)
+                chunk = pending[i:i + n]
+                index = bytearray()
+                for k, (t, _) in enumerate(chunk):
+                    if (self._count + k) % self.index_stride == 0:
+                        index += INDEX_ENTRY.pack(t, self._count + k)
+                self._data.write(b"".join(record for _, record in chunk))
+                self._index.write(index)
+                self._count += n
+                i += n
+            self._sync()
+        return len(pending)
+
+    def close(self):
+        self.flush()
+        with self._io_lock:
+            self._close_segment()
+
+    def _rotate(self, t):
+        self._close_segment()
+        path = os.path.join(self.directory, _segment_name(t))
+        self._data = open(path, "ab")
+        self._index = open(path[:-4] + ".idx", "ab")
+        self._count = 0
+
+    def _sync(self):
+        for f in (self._data, self._index):
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _close_segment(self):
+        if self._data is not None:
+            self._sync()
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+
+
+def segments(directory):
+    """(開始時刻, パス) のリストを時刻順に返す"""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(n for n in os.listdir(directory) if n.startswith("track-") and n.endswith(".bin"))
+    return [(_segment_start(n), os.path.join(directory, n)) for n in names]
+
+
+def _load_index(path):
+    try:
+        with open(path[:-4] + ".idx", "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return [], []
+    entries = [INDEX_ENTRY.unpack_from(raw, off) for off in range(0, len(raw) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size)]
+    return [t for t, _ in entries], [n for _, n in entries]
+
+
+def _scan_segment(path, start, end):
+    size = os.path.getsize(path)
+    # 書きかけで途切れた末尾は無視する
+    count = size // RECORD_SIZE
+    if count == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), count * RECORD_SIZE, access=mmap.ACCESS_READ) as mm:
+        # 疎なインデックスで範囲を絞り、その中を二分探索して開始位置を求める
+        idx_times, idx_recs = _load_index(path)
+        k = bisect_left(idx_times, start)
+        lo = idx_recs[k - 1] if k > 0 else 0
+        hi = min(idx_recs[k], count) if k < len(idx_recs) else count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if RECORD.unpack_from(mm, mid * RECORD_SIZE)[0] < start:
+                lo = mid + 1
+            else:
+                hi = mid
+        for n in range(lo, count):
+            record = RECORD.unpack_from(mm, n * RECORD_SIZE)
+            if record[0] > end:
+                break
+            yield record
+
+
+def query(directory, start, end):
+    """start <= t <= end の fix を (t, lat, lon, alt, speed, hdop) で順に返すジェネレータ
+
+    欠損値は NaN。ディスクに書き込み済みのものだけが対象。
+    """
+    segs = segments(directory)
+    starts = [s for s, _ in segs]
+    # start を含むセグメントから、end より後に始まるセグメントの手前まで
+    first = max(bisect_right(starts, start) - 1, 0)
+    last = bisect_right(starts, end)
+    for _, path in segs[first:last]:
+        yield from _scan_segment(path, start, end)
+
+
+def seconds_ago(directory, seconds):
+    """直近 seconds 秒分の fix (起動時に軌跡のリングバッファを埋め直すため)"""
+    now = time.time()
+    return query(directory, now - seconds, now)